@@ -0,0 +1,121 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import os
+
+from Timing import timer
+
+
+class BatchResult:
+    """
+    Outcome of one batch item: the input path plus either the returned value or the error text.
+    """
+
+    def __init__(self, path, value=None, error=None):
+        self.path = path
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _timed_call(func, *args):
+    """
+    Worker-side wrapper used while timing is enabled: runs 'func' with timing on
+    and returns its value together with the timing records of this call.
+    """
+    timer.enable()
+    value = func(*args)
+    return value, timer.records
+
+
+class BatchExecutor:
+    """
+    Runs an independent per-file function over many files on a process pool.
+    At most 'max_in_flight' items are submitted at a time, results are yielded
+    in input order and a failing file is recorded instead of stopping the run.
+    """
+
+    def __init__(self, workers=None, max_in_flight=None, initializer=None, initargs=()):
+        # Default to one worker per core and a small queue per worker.
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers * 2
+        # Called once per worker process (or once inline) to set up data shared by all items.
+        self.initializer = initializer
+        self.initargs = initargs
+        # Collects the failed results of the last run.
+        self.errors = []
+
+    def map(self, func, items):
+        """
+        Calls func(*args) for every args tuple in 'items' and yields a BatchResult for each.
+        The first element of every args tuple is taken as the file path for reporting.
+        'func' must be a module-level function or staticmethod so it can be pickled.
+        """
+        self.errors = []
+
+        if self.workers == 1:
+            # No pool: run inline, which is cheaper for one worker and easier to debug.
+            if self.initializer is not None:
+                self.initializer(*self.initargs)
+            for args in items:
+                yield self._record(self._call(func, args))
+            return
+
+        # Timing records are made in the workers, so they are sent back with every result.
+        timed = timer.enabled
+
+        def submit(pool, args):
+            if timed:
+                return pool.submit(_timed_call, func, *args)
+            return pool.submit(func, *args)
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer,
+                                 initargs=self.initargs) as pool:
+            pending = deque()
+            items = iter(items)
+
+            # Fill the window, then submit one new item for every finished one.
+            for args in items:
+                pending.append((args, submit(pool, args)))
+                if len(pending) >= self.max_in_flight:
+                    break
+
+            while pending:
+                args, future = pending.popleft()
+                try:
+                    value = future.result()
+                    if timed:
+                        value, records = value
+                        timer.records.extend(records)
+                    result = BatchResult(args[0], value=value)
+                except Exception as e:
+                    result = BatchResult(args[0], error=f"{type(e).__name__}: {e}")
+
+                next_args = next(items, None)
+                if next_args is not None:
+                    pending.append((next_args, submit(pool, next_args)))
+
+                yield self._record(result)
+
+    def print_errors(self):
+        """
+        Prints a summary of the files that failed in the last run.
+        """
+        if not self.errors:
+            return
+        print(f"{len(self.errors)} file(s) failed:")
+        for result in self.errors:
+            print(f"  {result.path}: {result.error}")
+
+    def _call(self, func, args):
+        try:
+            return BatchResult(args[0], value=func(*args))
+        except Exception as e:
+            return BatchResult(args[0], error=f"{type(e).__name__}: {e}")
+
+    def _record(self, result):
+        if not result.ok:
+            self.errors.append(result)
+        return result
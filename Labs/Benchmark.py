@@ -0,0 +1,224 @@
+import argparse
+import io
+import json
+import time
+
+from PIL import Image, ImageFilter
+import numpy as np
+
+import Lab1, Lab2, Lab3, Lab4, Lab5, Lab6
+import Metrics
+
+# Image modes the benchmark generates inputs in.
+MODES = ('L', 'RGB', 'RGBA', 'P')
+
+# Operations whose speed-up comes from decoding less: they get an undecoded JPEG (when the mode
+# allows it) and their kernel time includes the decode.
+LAZY_OPERATIONS = {"resize_fast"}
+
+
+class Benchmark:
+    """
+    Times the compute kernel of every Lab operation on synthetic images of several sizes and modes.
+    Decoding and encoding are timed separately, so kernel speed is not hidden behind I/O.
+    """
+
+    def __init__(self, repeat=3):
+        self.repeat = repeat
+        self.lab1 = Lab1.Lab1Processor()
+        self.lab2 = Lab2.Lab2Processor()
+        self.lab3 = Lab3.Lab3Processor()
+        self.lab4 = Lab4.Lab4Processor()
+        self.lab5 = Lab5.Lab5Processor()
+        self.lab6 = Lab6.Lab6Processor()
+        self.font = self.lab3.load_font("1", 36)
+
+    def operations(self):
+        """
+        Returns {name: kernel(img)} for the compute part of every Lab operation.
+        """
+        filters = self.lab6.get_filters()
+
+        def filter_analysis(img):
+            # The per-image work of run_analysis: every filter plus its MSE against the input.
+            gray = img.convert('L')
+            for _, f_obj, _ in filters:
+                self.lab6.calculate_mse(gray, gray.filter(f_obj))
+
+        def enhanceable(img):
+            # ImageEnhance rejects palette images, so P inputs are converted to RGB first (timed with the kernel).
+            return img.convert('RGB') if img.mode == 'P' else img
+
+        def slice_parts(img):
+            part_width = img.width // 4
+            return [img.crop((j * part_width, 0, (j + 1) * part_width, img.height)).load() for j in range(4)]
+
+        return {
+            # The conversion itself is the JPEG encode; prepare_for_format alone is a no-op for L/RGB.
+            "convert_format": lambda img: self.lab1.prepare_for_format(img, 'JPEG').save(
+                io.BytesIO(), 'JPEG', quality=90),
+            "resize": lambda img: self.lab1.resize_image(img, width=img.width // 4),
+            "resize_fast": lambda img: self.lab1.resize_image(img, width=img.width // 4, fast=True),
+            "convert_image_color": lambda img: self.lab1.replace_colors(
+                img, [((0, 0, 0), (255, 0, 0)), ((255, 255, 255), (0, 0, 255))], 10),
+            "image_color_balance": lambda img: self.lab1.balance_channels(img, (1.2, 1.0, 0.8)),
+            "brightness": lambda img: self.lab1.adjust_brightness(enhanceable(img), 1.2),
+            "add_transparency": lambda img: self.lab2.set_alpha(img, 0.5),
+            "alpha_gradient": lambda img: self.lab2.set_alpha_mask(img, 'radial', 1.0, 0.0, scale=True),
+            "crop_image": lambda img: self.lab2.crop(img, (0, 0, img.width // 2, img.height // 2)).load(),
+            "invert_crop": lambda img: self.lab2.cut_out(img, (0, 0, img.width // 2, img.height // 2)),
+            "slice_image": slice_parts,
+            "enhance_contrast": lambda img: self.lab2.change_contrast(enhanceable(img), 1.5),
+            "equalize": lambda img: self.lab2.equalize(img),
+            "clahe": lambda img: self.lab2.clahe(img),
+            "combine_images": lambda img: self.lab3.join_images(img, img, 'H'),
+            "add_watermark": lambda img: self.lab3.add_text(img, "Watermark", 'BR', font=self.font),
+            "convert_to_grayscale": lambda img: self.lab4.to_grayscale(img),
+            "invert_image": lambda img: self.lab4.to_negative(img),
+            "binarize_image": lambda img: self.lab4.to_binary(img, 128),
+            "binarize_otsu": lambda img: self.lab4.to_binary(
+                img, self.lab4.otsu_threshold(img.convert('L').histogram())),
+            "binarize_adaptive": lambda img: self.lab4.adaptive_binary(img, 'mean', 31, 5),
+            "roberts_edge_detection": lambda img: self.lab5.roberts_edge_image(img),
+            **{f"edges_{operator}": (lambda img, operator=operator: self.lab5.edge_image(img, operator))
+               for operator in Lab5.EDGE_OPERATORS if operator != 'roberts'},
+            "run_analysis": filter_analysis,
+            "quality_metrics": lambda img: Metrics.compare(
+                img.convert('L'), img.convert('L').filter(ImageFilter.BoxBlur(1))),
+        }
+
+    def make_image(self, megapixels, mode):
+        """
+        Generates a synthetic image: smooth gradients with noise, so that codecs have realistic work.
+        """
+        width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+        height = int(megapixels * 1e6 / width)
+        rng = np.random.default_rng(0)
+        y, x = np.mgrid[0:height, 0:width]
+        base = np.stack([x * 255 // max(width - 1, 1), y * 255 // max(height - 1, 1),
+                         (x + y) * 255 // max(width + height - 2, 1)], axis=-1)
+        noise = rng.integers(-20, 21, size=base.shape)
+        rgb = Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8), 'RGB')
+        if mode == 'RGBA':
+            rgb.putalpha(Image.fromarray((x * 255 // max(width - 1, 1)).astype(np.uint8), 'L'))
+            return rgb
+        return rgb.convert(mode)
+
+    def time_call(self, func, setup=None):
+        """
+        Returns the best wall time of 'repeat' calls in seconds.
+        The result of 'setup' (not timed) is passed to 'func'.
+        """
+        best = float('inf')
+        for _ in range(self.repeat):
+            args = () if setup is None else (setup(),)
+            start = time.perf_counter()
+            func(*args)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def run(self, sizes, modes, names=None):
+        """
+        Runs the benchmark and returns a list of result dicts.
+        """
+        operations = self.operations()
+        if names:
+            operations = {name: operations[name] for name in names}
+
+        results = []
+        for megapixels in sizes:
+            for mode in modes:
+                img = self.make_image(megapixels, mode)
+                buffer = io.BytesIO()
+                img.save(buffer, 'PNG')
+                encoded = buffer.getvalue()
+                buffer = io.BytesIO()
+                img.save(buffer, 'JPEG' if mode in ('L', 'RGB') else 'PNG', quality=90)
+                encoded_lazy = buffer.getvalue()
+                pixels = img.width * img.height / 1e6
+
+                # I/O is measured once per input and reported next to every kernel.
+                decode = self.time_call(lambda: Image.open(io.BytesIO(encoded)).load())
+                encode = self.time_call(lambda: img.save(io.BytesIO(), 'PNG'))
+
+                for name, kernel in operations.items():
+                    result = {"operation": name, "megapixels": megapixels, "mode": mode,
+                              "decode_ms": decode * 1000, "encode_ms": encode * 1000}
+                    try:
+                        if name in LAZY_OPERATIONS:
+                            seconds = self.time_call(kernel, lambda: Image.open(io.BytesIO(encoded_lazy)))
+                        else:
+                            # Every run gets its own decoded copy, so kernels that change it in place stay fair.
+                            seconds = self.time_call(kernel, img.copy)
+                        result["kernel_ms"] = seconds * 1000
+                        result["mpix_per_s"] = pixels / seconds
+                    except Exception as e:
+                        result["error"] = f"{type(e).__name__}: {e}"
+                    results.append(result)
+                    self.print_result(result)
+        return results
+
+    def print_result(self, result):
+        label = f"{result['operation']:<24} {result['megapixels']:>6.2f} MP {result['mode']:<5}"
+        if "error" in result:
+            print(f"{label} n/a ({result['error']})")
+            return
+        print(f"{label} kernel {result['kernel_ms']:>9.2f} ms {result['mpix_per_s']:>9.2f} MP/s | "
+              f"decode {result['decode_ms']:>8.2f} ms, encode {result['encode_ms']:>8.2f} ms")
+
+    def compare(self, results, baseline, tolerance):
+        """
+        Prints every kernel that got slower than the baseline by more than 'tolerance' percent.
+        Returns the number of regressions.
+        """
+        previous = {(r["operation"], r["megapixels"], r["mode"]): r for r in baseline}
+        regressions = 0
+        print("\n--- Comparison with baseline ---")
+        for result in results:
+            old = previous.get((result["operation"], result["megapixels"], result["mode"]))
+            if old is None or "mpix_per_s" not in old or "mpix_per_s" not in result:
+                continue
+            change = (result["mpix_per_s"] / old["mpix_per_s"] - 1) * 100
+            marker = ""
+            if change < -tolerance:
+                marker = "  <-- REGRESSION"
+                regressions += 1
+            print(f"{result['operation']:<24} {result['megapixels']:>6.2f} MP {result['mode']:<5} "
+                  f"{old['mpix_per_s']:>9.2f} -> {result['mpix_per_s']:>9.2f} MP/s ({change:+.1f}%){marker}")
+        print(f"{regressions} regression(s) over {tolerance}%.")
+        return regressions
+
+
+def main():
+    """
+    Entry point: python Benchmark.py [--sizes 0.25 1 4] [--baseline base.json] [--save-baseline base.json]
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the Lab operations on synthetic images.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.25, 1, 4], help="image sizes in megapixels")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES, help="image modes")
+    parser.add_argument("--ops", nargs="+", help="operations to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one counts")
+    parser.add_argument("--baseline", help="JSON file with earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=10, help="allowed slowdown in percent")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args.repeat)
+    results = benchmark.run(args.sizes, args.modes, args.ops)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if benchmark.compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    # Execute main() when the script is run directly.
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import uuid
+
+
+class ResultCache:
+    """
+    On-disk cache of operation results, keyed by the input file content, the operation name and its parameters.
+    Every entry is a folder with the output files; the least recently used entries are evicted
+    once the cache grows over 'max_bytes'.
+    """
+
+    # Output names that start with the input stem are stored with this placeholder instead,
+    # so a hit for a renamed copy of the same file produces correctly named outputs.
+    STEM = "{stem}"
+
+    def __init__(self, cache_dir, max_bytes=1024 * 1048576):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key(self, path, operation, params, extra_files=()):
+        """
+        Builds the cache key from the SHA-256 of the file content, the operation and its parameters.
+        The content of 'extra_files' (other inputs named in the parameters, e.g. a mask) is hashed too,
+        so editing one of them invalidates the result.
+        """
+        digest = hashlib.sha256()
+        for file_path in (path, *extra_files):
+            with open(file_path, 'rb') as f:
+                # Read in 1 MB chunks to keep memory flat for big files.
+                for chunk in iter(lambda: f.read(1048576), b''):
+                    digest.update(chunk)
+        digest.update(operation.encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def get(self, key, path, output_dir):
+        """
+        Copies the cached outputs for 'key' to 'output_dir'.
+        Returns the output path(s) as the operation returned them, or None on a miss.
+        """
+        entry = self.cache_dir / key
+        try:
+            with open(entry / "manifest.json", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        stem = pathlib.Path(path).stem
+        output_paths = []
+        for name in manifest["files"]:
+            output_path = pathlib.Path(output_dir) / name.replace(self.STEM, stem, 1)
+            shutil.copyfile(entry / name, output_path)
+            output_paths.append(output_path)
+
+        # Mark the entry as recently used for LRU eviction.
+        os.utime(entry)
+        return output_paths if manifest["many"] else output_paths[0]
+
+    def put(self, key, path, value):
+        """
+        Stores the output path(s) returned by an operation under 'key'.
+        """
+        entry = self.cache_dir / key
+        if value is None or entry.exists():
+            return
+
+        many = isinstance(value, (list, tuple))
+        output_paths = value if many else [value]
+        stem = pathlib.Path(path).stem
+
+        # Build the entry in a temporary folder and rename it, so parallel workers never see half of it.
+        tmp = self.cache_dir / f".{key}.{uuid.uuid4().hex}"
+        tmp.mkdir()
+        names = []
+        for output_path in output_paths:
+            name = pathlib.Path(output_path).name
+            if name.startswith(stem):
+                name = self.STEM + name[len(stem):]
+            shutil.copyfile(output_path, tmp / name)
+            names.append(name)
+        with open(tmp / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump({"files": names, "many": many}, f)
+
+        try:
+            tmp.rename(entry)
+        except OSError:
+            # Another worker stored the same result first.
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits into 'max_bytes'.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except FileNotFoundError:
+                continue
+            total += size
+
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total -= size
@@ -1,7 +1,11 @@
 import tkinter as tk
 from tkinter import filedialog
+from PIL import Image
+import io
 import os
 
+from Timing import timer
+
 # Map of user-friendly format names to their standard file extensions.
 ALL_IMAGE_FORMATS_MAP = {
     'png': '.png',
@@ -20,6 +24,38 @@ FONT_MAP = {
             "5": ("Comic Sans", "comic.ttf")
         }
 
+def load_image(path, lazy=False):
+    """
+    Opens an image file. With timing enabled the pixels are decoded right away, so the decode
+    is recorded as its own stage; otherwise decoding stays lazy as in Image.open.
+    'lazy' keeps it lazy in any case, for callers that reduce on decode (draft).
+    """
+    img = Image.open(path)
+    if timer.enabled and not lazy:
+        with timer.stage("decode"):
+            img.load()
+    return img
+
+
+def save_image(img, path, format=None, **params):
+    """
+    Saves an image like Image.save. With timing enabled it is encoded in memory first,
+    so encoding and writing the file are recorded as separate stages.
+    """
+    if not timer.enabled:
+        img.save(path, format=format, **params)
+        return
+
+    if format is None:
+        format = Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+    buffer = io.BytesIO()
+    with timer.stage("encode"):
+        img.save(buffer, format=format, **params)
+    with timer.stage("write"):
+        with open(path, "wb") as f:
+            f.write(buffer.getbuffer())
+
+
 class Service:
     """
     Class for all file and user interaction operations (I/O, path handling, size calculations).
@@ -117,35 +153,16 @@ class Service:
         print(f"Change in size: {size_2 - size_1:.2f}Mb")
         print("-----------------------------------")
 
-    def calculate_size_by_height_and_width(self):
-        """
-        Prompts the user for both new width and height for image resizing.
-        """
-        size = (int(input("Input your width")), int(input("Input your height")))
-        return size
-
-    def calculate_size_by_height(self, old_size):
-        """
-        Prompts the user for a new height and calculates the corresponding width
-        to maintain the original aspect ratio.
-        """
-        new_height = int(input("Input new height: "))
-        # Calculate the aspect ratio (width / height).
-        ratio: float | int = old_size[0] / old_size[1]
-        # Calculate the new width based on the ratio.
-        new_width: int = int(new_height * ratio)
-        new_size = (new_width, new_height)
-        return new_size
-
-    def calculate_size_by_width(self, old_size):
+    def get_resize_rule(self, command):
         """
-        Prompts the user for a new width and calculates the corresponding height
-        to maintain the original aspect ratio.
+        Prompts the user for one resize rule for the whole batch and returns (width, height).
+        'H' asks only for the height and 'W' only for the width (the other side is None,
+        so it is calculated per image to maintain the aspect ratio); 'HW' asks for both.
         """
-        new_width = int(input("Input new width: "))
-        # Calculate the inverse aspect ratio (height / width).
-        ratio: float | int = old_size[1] / old_size[0]
-        # Calculate the new height based on the ratio.
-        new_height: int = int(new_width * ratio)
-        new_size = (new_width, new_height)
-        return new_size
+        width = None
+        height = None
+        if command in ('W', 'HW'):
+            width = int(input("Input new width: "))
+        if command in ('H', 'HW'):
+            height = int(input("Input new height: "))
+        return width, height
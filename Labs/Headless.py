@@ -0,0 +1,268 @@
+import argparse
+import glob
+import json
+import os
+import pathlib
+import sys
+
+import matplotlib
+
+# Histograms are written to files in headless mode, so no GUI backend is needed.
+matplotlib.use('Agg')
+
+import Lab1, Lab2, Lab3, Lab4, Lab5, Lab6
+from Batch import BatchExecutor
+from Cache import ResultCache
+from Pipeline import PipelineProcessor
+from Tiles import TiledProcessor
+from Timing import timer
+
+# Operation name -> (processor, method, kind).
+# 'file' methods are called as method(path, output_dir, **params) for every file,
+# 'view' methods as method(path, **params), 'files' methods get all paths at once
+# and 'run' methods take only the parameters (they return None when they couldn't run).
+OPERATIONS = {
+    # Lab 1
+    "convert_format": ("lab1", "convert_file_format", "file"),
+    "resize": ("lab1", "resize_file", "file"),
+    "recolor": ("lab1", "recolor_file", "file"),
+    "color_balance": ("lab1", "balance_file", "file"),
+    # Lab 2
+    "transparency": ("lab2", "transparency_file", "file"),
+    "crop": ("lab2", "crop_file", "file"),
+    "crop_spec": ("lab2", "crop_spec_file", "file"),
+    "invert_crop": ("lab2", "invert_crop_file", "file"),
+    "slice": ("lab2", "slice_file", "file"),
+    "pyramid": ("lab2", "pyramid_file", "file"),
+    "contrast": ("lab2", "contrast_file", "file"),
+    "auto_contrast": ("lab2", "auto_contrast_file", "file"),
+    # Lab 3
+    "combine": ("lab3", "combine_files", "files"),
+    "mosaic": ("lab3", "mosaic_files", "files"),
+    "watermark": ("lab3", "watermark_file", "file"),
+    # Lab 4
+    "brightness_matrix": ("lab4", "brightness_matrix_file", "view"),
+    "brightness_npy": ("lab4", "brightness_npy_file", "file"),
+    "color_histogram": ("lab4", "color_histogram_file", "file"),
+    "grayscale_histogram": ("lab4", "grayscale_histogram_file", "file"),
+    "histogram_batch": ("lab4", "histogram_batch", "files"),
+    "grayscale": ("lab4", "grayscale_file", "file"),
+    "negative": ("lab4", "invert_file", "file"),
+    "binarize": ("lab4", "binarize_file", "file"),
+    "derivatives": ("lab4", "derivatives_file", "file"),
+    # Lab 5
+    "roberts": ("lab5", "roberts_file", "file"),
+    "edges": ("lab5", "edge_file", "file"),
+    # Lab 6
+    "filter_analysis": ("lab6", "run_analysis", "run"),
+    # Several operations with one decode and one encode per file
+    "pipeline": ("pipeline", "pipeline_file", "file"),
+    # Band-by-band processing of images that don't fit into memory
+    "tiled": ("tiled", "tiled_file", "file"),
+}
+
+# Operations the result cache can't store: folder trees.
+UNCACHED_OPERATIONS = {"pyramid"}
+
+# Parameters that name another input file (at any depth, e.g. inside pipeline steps).
+# Their content is part of the cache key.
+FILE_PARAMS = {"mask", "spec"}
+
+
+def param_files(params):
+    """
+    Returns the paths given in FILE_PARAMS anywhere in 'params', in a stable order.
+    """
+    files = []
+    if isinstance(params, dict):
+        for name, value in sorted(params.items()):
+            if name in FILE_PARAMS and isinstance(value, (str, os.PathLike)):
+                files.append(value)
+            else:
+                files.extend(param_files(value))
+    elif isinstance(params, (list, tuple)):
+        for value in params:
+            files.extend(param_files(value))
+    return files
+
+
+class HeadlessRunner:
+    """
+    Runs Lab processor operations from job descriptions instead of dialogs and input() prompts.
+    One runner keeps its processors for the whole process, so many jobs share them.
+    With a ResultCache, per-file results for unchanged inputs and parameters are copied from the cache
+    instead of being decoded, computed and encoded again.
+
+    A job is a dict like:
+        {"operation": "resize", "files": ["photos/*.jpg"], "output_dir": "out",
+         "params": {"width": 256}, "workers": 4}
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache
+        # Cache statistics of all jobs run by this runner.
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.processors = {
+            "lab1": Lab1.Lab1Processor(),
+            "lab2": Lab2.Lab2Processor(),
+            "lab3": Lab3.Lab3Processor(),
+            "lab4": Lab4.Lab4Processor(),
+            "lab5": Lab5.Lab5Processor(),
+            "lab6": Lab6.Lab6Processor(),
+        }
+        self.processors["pipeline"] = PipelineProcessor(self.processors)
+        self.processors["tiled"] = TiledProcessor(self.processors)
+
+    def expand_files(self, patterns):
+        """
+        Expands a list of file paths and glob patterns into a list of existing files.
+        """
+        files = []
+        for pattern in patterns:
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                print(f"No files match {pattern}")
+            files.extend(match for match in matches if pathlib.Path(match).is_file())
+        return files
+
+    def run_file(self, operation, path, output_dir, params, cache=None):
+        """
+        Runs one per-file operation and returns (result, cache_hit), where result
+        is what the processor method returned.
+        """
+        lab, method, kind = OPERATIONS[operation]
+        func = getattr(self.processors[lab], method)
+        if kind == 'view':
+            return func(path, **params), False
+
+        if cache is None or operation in UNCACHED_OPERATIONS:
+            return func(path, output_dir, **params), False
+
+        key = cache.key(path, operation, params, param_files(params))
+        value = cache.get(key, path, output_dir)
+        if value is not None:
+            return value, True
+        value = func(path, output_dir, **params)
+        cache.put(key, path, value)
+        return value, False
+
+    def run_job(self, job):
+        """
+        Runs one job and returns the number of failed files.
+        """
+        operation = job["operation"]
+        if operation not in OPERATIONS:
+            print(f"Unknown operation '{operation}'. Available: {', '.join(OPERATIONS)}")
+            return 1
+
+        lab, method, kind = OPERATIONS[operation]
+        params = job.get("params", {})
+        output_dir = job.get("output_dir")
+        if output_dir:
+            pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+        print(f"\n=== {operation} ===")
+        func = getattr(self.processors[lab], method)
+
+        if kind == 'run':
+            try:
+                if func(**params) is None:
+                    print(f"{operation} did not complete.")
+                    return 1
+                return 0
+            except Exception as e:
+                print(f"Failed to run {operation}: {e}")
+                return 1
+
+        files = self.expand_files(job.get("files", []))
+        if kind == 'files':
+            try:
+                func(files, output_dir, **params)
+                return 0
+            except Exception as e:
+                print(f"Failed to run {operation}: {e}")
+                return 1
+
+        executor = BatchExecutor(job.get("workers", 1))
+        jobs = ((path, operation, output_dir, params, self.cache) for path in files)
+        done = 0
+        hits = 0
+        for result in executor.map(run_file, jobs):
+            if result.ok:
+                done += 1
+                hits += result.value[1]
+        print(f"{operation}: {done} of {len(files)} file(s) processed.")
+        if self.cache is not None:
+            print(f"Cache: {hits} hit(s), {done - hits} miss(es).")
+            self.cache_hits += hits
+            self.cache_misses += done - hits
+        executor.print_errors()
+        return len(executor.errors)
+
+    def run(self, jobs):
+        """
+        Runs a list of jobs in order and returns the total number of failures.
+        """
+        return sum(self.run_job(job) for job in jobs)
+
+
+# Runner of the current process, created on first use (also inside pool workers).
+_runner = None
+
+
+def run_file(path, operation, output_dir, params, cache=None):
+    """
+    Module-level entry for BatchExecutor, so per-file work can be sent to worker processes.
+    """
+    global _runner
+    if _runner is None:
+        _runner = HeadlessRunner()
+    return _runner.run_file(operation, path, output_dir, params, cache)
+
+
+def load_jobs(job_path):
+    """
+    Reads a job file: one job object, a list of jobs or {"jobs": [...]}.
+    """
+    with open(job_path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("jobs", [data])
+    return data
+
+
+def main():
+    """
+    Entry point for unattended runs: python Headless.py job.json [job2.json ...] [--cache DIR] [--timing]
+    """
+    parser = argparse.ArgumentParser(description="Run Lab operations from JSON job files.",
+                                     epilog=f"Operations: {', '.join(OPERATIONS)}")
+    parser.add_argument("jobs", nargs="+", help="job files")
+    parser.add_argument("--cache", help="folder of the result cache (disabled when not given)")
+    parser.add_argument("--cache-size", type=int, default=1024, help="cache size limit in MB (default 1024)")
+    parser.add_argument("--timing", action="store_true", help="print per-stage timings of every operation")
+    parser.add_argument("--timing-json", help="also write the per-file timing records to this JSON file")
+    args = parser.parse_args()
+
+    if args.timing or args.timing_json:
+        timer.enable()
+    cache = ResultCache(args.cache, args.cache_size * 1048576) if args.cache else None
+
+    global _runner
+    _runner = HeadlessRunner(cache)
+    failures = 0
+    for job_path in args.jobs:
+        failures += _runner.run(load_jobs(job_path))
+    if cache is not None:
+        print(f"\nCache total: {_runner.cache_hits} hit(s), {_runner.cache_misses} miss(es).")
+    if timer.enabled:
+        timer.summary()
+        if args.timing_json:
+            timer.write_json(args.timing_json)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    # Execute main() when the script is run directly.
+    sys.exit(main())
@@ -1,8 +1,18 @@
 from PIL import Image, ImageEnhance
+import numpy as np
 import pathlib
 
 import Lab2
-from Common import Service, ALL_IMAGE_FORMATS_MAP
+from Batch import BatchExecutor
+from Common import Service, ALL_IMAGE_FORMATS_MAP, load_image, save_image
+from Timing import timer
+
+# Image modes the Pillow writers can store, for formats that don't take every mode.
+STORABLE_MODES = {
+    'JPEG': ('L', 'RGB', 'CMYK'),
+    'BMP': ('1', 'L', 'P', 'RGB', 'RGBA'),
+    'PNG': ('1', 'L', 'LA', 'I', 'I;16', 'P', 'RGB', 'RGBA'),
+}
 
 
 class Lab1Processor:
@@ -10,188 +20,339 @@ class Lab1Processor:
     Class for all core image manipulation operations using the PIL (Pillow) library.
     """
 
-    def __init__(self):
+    def __init__(self, workers=None, max_in_flight=None):
         self.image_paths = None
         self.output_path = None
         # Initialize the utility service class.
         self.service = Service()
+        # Runs the independent per-file work of batch operations in parallel.
+        self.executor = BatchExecutor(workers, max_in_flight)
 
-    def convert_image_format(self):
+    @staticmethod
+    def fit_size(old_size, width=None, height=None):
         """
-        Converts a batch of selected images to a user-specified format.
-        Handles transparency/color-mode conversion for formats that don't support it (e.g., JPEG, BMP).
+        Calculates the target size from a resize rule.
+        With both width and height the size is taken as is (ratio not necessarily maintained),
+        with only one of them the other side is calculated to keep the original aspect ratio.
         """
-        files = self.service.get_images()
-        targeted_format = self.service.get_targeted_format()
-        output_dir = self.service.get_output_dir()
+        if width and height:
+            return int(width), int(height)
+        if height:
+            # Calculate the aspect ratio (width / height).
+            ratio: float | int = old_size[0] / old_size[1]
+            return int(height * ratio), int(height)
+        if width:
+            # Calculate the inverse aspect ratio (height / width).
+            ratio: float | int = old_size[1] / old_size[0]
+            return int(width), int(width * ratio)
+        raise ValueError("Width or height must be given")
 
-        for i in files:
-            img = Image.open(i)
-            # Handle transparency (RGBA/P) for formats that don't support it well (JPEG, BMP).
-            if targeted_format.upper() in ('JPEG', 'BMP') and img.mode in ('RGBA', 'P'):
+    @staticmethod
+    def prepare_for_format(img, targeted_format):
+        """
+        Handles transparency/color-mode conversion for formats that don't support it (e.g., JPEG, BMP).
+        """
+        target = targeted_format.upper()
+        # Handle transparency (RGBA/LA/P) for formats that don't support it well (JPEG, BMP).
+        if target in ('JPEG', 'BMP') and img.mode in ('RGBA', 'LA', 'PA', 'P'):
 
-                print(f"-> Find transparency ({img.mode}). Convert to RGB.")
-                # Create a white background image.
+            print(f"-> Find transparency ({img.mode}). Convert to {'L' if img.mode == 'LA' else 'RGB'}.")
+            # Create a white background image; grayscale stays grayscale.
+            if img.mode == 'LA':
+                background = Image.new("L", img.size, 255)
+            else:
                 background = Image.new("RGB", img.size, (255, 255, 255))
 
-                # Convert palette mode (P) to RGBA first if necessary.
-                if img.mode == 'P':
+            # Convert palette modes (P/PA) to RGBA first if necessary.
+            if img.mode in ('P', 'PA'):
+                with timer.stage("convert"):
                     img = img.convert('RGBA')
 
-                # Paste the image onto the background using the alpha channel as a mask.
-                # This effectively replaces transparency with white.
-                background.paste(img, mask=img.split()[3])
-
-                img = background.convert('RGB')
-            # Convert CMYK mode to RGB, as many operations/formats prefer RGB.
-            elif img.mode == 'CMYK':
+            # Paste the image onto the background using the alpha channel as a mask.
+            # This effectively replaces transparency with white.
+            with timer.stage("convert"):
+                background.paste(img.convert(background.mode), mask=img.getchannel('A'))
+            img = background
+        # Modes the format can't store (e.g. '1' in JPEG, 32-bit in BMP): single-band images become grayscale,
+        # the others RGB.
+        elif target in STORABLE_MODES and img.mode not in STORABLE_MODES[target]:
+            with timer.stage("convert"):
+                img = img.convert('L' if len(img.getbands()) == 1 else 'RGB')
+        # Convert CMYK mode to RGB, as many operations/formats prefer RGB.
+        elif img.mode == 'CMYK':
+            with timer.stage("convert"):
                 img = img.convert('RGB')
+        return img
+
+    @staticmethod
+    @timer.timed
+    def convert_file_format(path, output_dir, targeted_format):
+        """
+        Converts one image file to 'targeted_format' and returns the output path.
+        """
+        # PIL prefers 'jpeg' over 'jpg' for saving.
+        if targeted_format == 'jpg':
+            targeted_format = 'jpeg'
+
+        img = Lab1Processor.prepare_for_format(load_image(path), targeted_format)
+
+        # Construct the output file path.
+        filename = pathlib.Path(path).stem
+        extension = ALL_IMAGE_FORMATS_MAP[targeted_format]
+        output_path = pathlib.Path(output_dir) / (filename + extension)
+
+        # Save the image with the new format and a quality setting of 90 (for lossy formats).
+        save_image(img, output_path, format=targeted_format, quality=90)
+        img.close()
+        return output_path
+
+    @staticmethod
+    def resize_image(img, width=None, height=None, fast=False):
+        """
+        Resizes an image by the rule described in fit_size.
+        Uses Image.Resampling.LANCZOS for high-quality downsampling/resizing.
+        With 'fast' the image is first brought close to the target size cheaply:
+        JPEG files are draft-decoded at 1/2, 1/4 or 1/8 scale and the rest is
+        shrunk with Image.reduce, then LANCZOS does only the final step.
+        """
+        new_size = Lab1Processor.fit_size(img.size, width, height)
+        if not fast:
+            return img.resize(new_size, Image.Resampling.LANCZOS)
 
-            # Construct the output file path.
-            filename = pathlib.Path(i).stem
-            extension = ALL_IMAGE_FORMATS_MAP[targeted_format]
-            output_path = output_dir + "\\" + filename + extension
+        # Keep at least twice the target size so the final resample still has detail to work with.
+        # draft() must run before the pixels are loaded; it is a no-op for non-JPEG files.
+        box = None
+        draft = img.draft(None, (new_size[0] * 2, new_size[1] * 2))
+        if draft is not None:
+            # The area of the scaled image that matches the original frame.
+            box = draft[1]
+        # reducing_gap makes resize() call Image.reduce() by an integer factor before LANCZOS.
+        return img.resize(new_size, Image.Resampling.LANCZOS, box=box, reducing_gap=2.0)
+
+    @staticmethod
+    @timer.timed
+    def resize_file(path, output_dir, width=None, height=None, fast=False):
+        """
+        Resizes one image file and returns the output path.
+        """
+        resized_img = Lab1Processor.resize_image(load_image(path, lazy=fast), width, height, fast)
+        # Save the resized image with a "_resized" suffix.
+        filename = pathlib.Path(path).stem + "_resized" + pathlib.Path(path).suffix
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(resized_img, output_path)
+        return output_path
+
+    def convert_image_format(self):
+        """
+        Converts a batch of selected images to a user-specified format.
+        Files are converted in parallel and reported in the order they were selected.
+        """
+        files = self.service.get_images()
+        targeted_format = self.service.get_targeted_format()
+        output_dir = self.service.get_output_dir()
 
-            # Save the image with the new format and a quality setting of 90 (for lossy formats).
-            img.save(output_path, format=targeted_format, quality=90)
-            img.close()
-            # Compare and print the size change.
-            self.service.compare_file_size(i, output_path)
+        jobs = ((i, output_dir, targeted_format) for i in files)
+        for result in self.executor.map(self.convert_file_format, jobs):
+            if result.ok:
+                # Compare and print the size change.
+                self.service.compare_file_size(result.path, result.value)
+        self.executor.print_errors()
 
     def convert_image_size(self, command):
         """
         Resizes all selected images based on the user's choice:
         'H' (height), 'W' (width), or 'HW' (both height and width).
-        Uses Image.Resampling.LANCZOS for high-quality downsampling/resizing.
+        One resize rule is asked for the whole batch, then the files are resized in parallel.
         """
         files = self.service.get_images()
         output_dir = self.service.get_output_dir()
 
-        # Determine the resizing method based on the command.
-        match command:
-            case 'H':
-                for i in files:
-                    img = Image.open(i)
-                    current_size = img.size
-                    # Calculate new size based on user-input height, maintaining ratio.
-                    new_size = self.service.calculate_size_by_height(current_size)
-                    resized_img = img.resize(new_size, Image.Resampling.LANCZOS)
-                    # Save the resized image with a "_resized" suffix.
-                    filename = pathlib.Path(i).stem + "_resized" + pathlib.Path(i).suffix
-                    output_path = pathlib.Path(output_dir) / filename
-                    resized_img.save(output_path)
-            case 'W':
-                for i in files:
-                    img = Image.open(i)
-                    current_size = img.size
-                    # Calculate new size based on user-input width, maintaining ratio.
-                    new_size = self.service.calculate_size_by_width(current_size)
-                    resized_img = img.resize(new_size, Image.Resampling.LANCZOS)
-                    # Save the resized image.
-                    filename = pathlib.Path(i).stem + "_resized" + pathlib.Path(i).suffix
-                    output_path = pathlib.Path(output_dir) / filename
-                    resized_img.save(output_path)
-            case 'HW':
-                for i in files:
-                    img = Image.open(i)
-                    # Get new size from user-input width and height (ratio not necessarily maintained).
-                    new_size = self.service.calculate_size_by_height_and_width()
-                    resized_img = img.resize(new_size, Image.Resampling.LANCZOS)
-                    # Save the resized image.
-                    filename = pathlib.Path(i).stem + "_resized" + pathlib.Path(i).suffix
-                    output_path = pathlib.Path(output_dir) / filename
-                    resized_img.save(output_path)
+        # Determine the resizing rule based on the command.
+        width, height = self.service.get_resize_rule(command)
+        fast = input("Use fast downscale mode for big images (Y/N)? ").upper() == 'Y'
+
+        jobs = ((i, output_dir, width, height, fast) for i in files)
+        for result in self.executor.map(self.resize_file, jobs):
+            if result.ok:
+                print(f"Resized image saved as {pathlib.Path(result.value).name}")
+        self.executor.print_errors()
+
+    def replace_colors(self, img, mappings, tolerance=0):
+        """
+        Replaces several old RGB colors with new ones in a single vectorized pass.
+        'mappings' is a list of (old_color, new_color) pairs; when mappings overlap,
+        the first one wins. 'tolerance' is either one int or an (r, g, b) tuple
+        with the allowed per-channel deviation from the old color.
+        Returns the recolored RGB image and the number of changed pixels.
+        """
+        # Convert to RGB mode to ensure consistency for color manipulation.
+        if img.mode != 'RGB':
+            with timer.stage("convert"):
+                img = img.convert('RGB')
+
+        if isinstance(tolerance, int):
+            tolerance = (tolerance, tolerance, tolerance)
+
+        pixels = np.array(img)
+        if not mappings:
+            return img, 0
+
+        if not any(tolerance):
+            # Exact matching: pack every pixel into one 24-bit key and look all
+            # old colors up at once with a binary search over the sorted keys.
+            keys = pixels[..., 0].astype(np.uint32) << 16
+            keys |= pixels[..., 1].astype(np.uint32) << 8
+            keys |= pixels[..., 2]
+            old_keys = np.array([(r << 16) | (g << 8) | b for (r, g, b), _ in mappings], dtype=np.uint32)
+            # np.unique keeps the first index of every duplicate, so the first mapping wins.
+            old_keys, first = np.unique(old_keys, return_index=True)
+            new_colors = np.array([mappings[j][1] for j in first], dtype=np.uint8)
+
+            index = np.searchsorted(old_keys, keys)
+            np.minimum(index, len(old_keys) - 1, out=index)
+            mask = old_keys[index] == keys
+            pixels[mask] = new_colors[index[mask]]
+            changes_count = int(np.count_nonzero(mask))
+        else:
+            # Tolerance matching: compare every channel against its [low, high] range.
+            # All comparisons stay in uint8, so no wide temporaries are created.
+            assigned = np.zeros(pixels.shape[:2], dtype=bool)
+            masks = []
+            for old_color, new_color in mappings:
+                mask = ~assigned
+                for channel in range(3):
+                    low = max(0, old_color[channel] - tolerance[channel])
+                    high = min(255, old_color[channel] + tolerance[channel])
+                    mask &= (pixels[..., channel] >= low) & (pixels[..., channel] <= high)
+                assigned |= mask
+                masks.append((mask, new_color))
+            # Write only after all masks are built so a mapping never matches its own output.
+            for mask, new_color in masks:
+                pixels[mask] = new_color
+            changes_count = int(np.count_nonzero(assigned))
+
+        return Image.fromarray(pixels, 'RGB'), changes_count
+
+    @timer.timed
+    def recolor_file(self, path, output_dir, mappings, tolerance=0):
+        """
+        Replaces colors in one image file and returns the output path.
+        """
+        img = load_image(path)
+        width, height = img.size
+
+        print(f"Розмір зображення: {width}x{height} пікселів.")
+
+        img, changes_count = self.replace_colors(img, mappings, tolerance)
+
+        print(f"Color change completed. Changed {changes_count} pixels.")
+        # Save the recolored image.
+        filename = pathlib.Path(path).stem + "_recolored" + pathlib.Path(path).suffix
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(img, output_path)
+        return output_path
 
     def convert_image_color(self):
         """
-        Converts a specific old RGB color in the selected images to a new RGB color.
-        Performs a pixel-by-pixel check and replacement.
+        Converts one or more old RGB colors in the selected images to new RGB colors.
+        All mappings are applied at once with an optional per-channel tolerance.
         """
         files = self.service.get_images()
         output_dir = self.service.get_output_dir()
 
-        # Get old and new colors from the user in 'r g b' format.
-        r, g, b = map(int, input("Input old color in r g b (for example 255 0 0 )):").split(" "))
-        old_color = (r, g, b)
-        r, g, b = map(int, input("Input new color in r g b (for example 255 0 0 )):").split(" "))
-        new_color = (r, g, b)
+        # Get pairs of old and new colors from the user in 'r g b' format.
+        mappings = []
+        while True:
+            r, g, b = map(int, input("Input old color in r g b (for example 255 0 0 )):").split(" "))
+            old_color = (r, g, b)
+            r, g, b = map(int, input("Input new color in r g b (for example 255 0 0 )):").split(" "))
+            new_color = (r, g, b)
+            mappings.append((old_color, new_color))
+            if input("Add another color pair? (Y/N): ").upper() != 'Y':
+                break
+
+        # Tolerance is either one number for all channels or 'r g b' per channel.
+        tolerance_input = input("Input color tolerance (0-255 or 'r g b', default 0): ").split()
+        if len(tolerance_input) == 3:
+            tolerance = tuple(map(int, tolerance_input))
+        elif tolerance_input:
+            tolerance = int(tolerance_input[0])
+        else:
+            tolerance = 0
 
         for i in files:
-            img = Image.open(i)
-            # Convert to RGB mode to ensure consistency for color manipulation.
-            if img.mode != 'RGB':
+            self.recolor_file(i, output_dir, mappings, tolerance)
+
+    def balance_channels(self, img, factors):
+        """
+        Multiplies the R, G and B channels by their own factors in one pass.
+        'factors' is an (r, g, b) tuple; each channel is mapped through a
+        256-entry lookup table, so the cost does not depend on Python per-pixel work.
+        """
+        # Ensure image is in RGB mode for consistent channel order.
+        if img.mode != 'RGB':
+            with timer.stage("convert"):
                 img = img.convert('RGB')
 
-            # Load pixels for direct manipulation.
-            pixels = img.load()
-            width, height = img.size
+        # One LUT per channel, concatenated in band order as Image.point expects.
+        lut = []
+        for factor in factors:
+            # Clamp the new value between 0 and 255.
+            lut.extend(max(0, min(255, int(value * factor))) for value in range(256))
 
-            print(f"Розмір зображення: {width}x{height} пікселів.")
+        return img.point(lut)
 
-            changes_count = 0
+    def adjust_brightness(self, img, factor):
+        """
+        Changes the overall brightness of an image.
+        """
+        # Use PIL's built-in Brightness enhancer for overall brightness.
+        enhancer = ImageEnhance.Brightness(img)
+        return enhancer.enhance(factor)
 
-            # Iterate through every pixel.
-            for x in range(width):
-                for y in range(height):
-                    current_color = pixels[x, y]
+    @timer.timed
+    def balance_file(self, path, output_dir, factors=(1.0, 1.0, 1.0), brightness=None):
+        """
+        Balances the channels of one image file, or its overall brightness
+        when 'brightness' is given, and returns the output path.
+        """
+        img = load_image(path)
 
-                    # Compare the current pixel color with the target 'old_color'.
-                    if current_color == old_color:
-                        # Change the pixel color.
-                        pixels[x, y] = new_color
-                        changes_count += 1
+        if brightness is not None:
+            img_output = self.adjust_brightness(img, brightness)
+        else:
+            img_output = self.balance_channels(img, factors)
 
-            print(f"Color change completed. Changed {changes_count} pixels.")
-            # Save the recolored image.
-            filename = pathlib.Path(i).stem + "_recolored" + pathlib.Path(i).suffix
-            output_path = pathlib.Path(output_dir) / filename
-            img.save(output_path)
+        # Save the balanced image.
+        filename = pathlib.Path(path).stem + "_balanced" + pathlib.Path(path).suffix
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(img_output, output_path)
+        return output_path
 
     def image_color_balance(self, mode):
         """
-        Adjusts the color balance (R, G, B) or overall brightness (ALL) of selected images.
-        Uses ImageEnhance.Brightness for 'ALL' mode and manual pixel manipulation for R/G/B.
+        Adjusts the color balance (R, G, B), all three channels at once (RGB)
+        or overall brightness (ALL) of selected images.
+        Uses ImageEnhance.Brightness for 'ALL' mode and per-channel lookup tables otherwise.
         """
         files = self.service.get_images()
         output_dir = self.service.get_output_dir()
 
-        # Get the balance factor (e.g., 1.2 for 20% increase, 0.8 for 20% decrease).
-        factor = float(input(
-            "Input balance factor (for example: 1.2 will increase color/brightness by 20%, 0.8 will decrees by 20%): "))
+        if mode == "RGB":
+            # Separate factors let a color cast be fixed in a single pass.
+            factors = tuple(
+                float(input(f"Input {channel} balance factor (for example: 1.2 will increase by 20%): "))
+                for channel in ('R', 'G', 'B')
+            )
+        else:
+            # Get the balance factor (e.g., 1.2 for 20% increase, 0.8 for 20% decrease).
+            factor = float(input(
+                "Input balance factor (for example: 1.2 will increase color/brightness by 20%, 0.8 will decrees by 20%): "))
+            # Map mode ('R', 'G', 'B') to the factors applied to each channel.
+            factors = tuple(factor if channel == mode else 1.0 for channel in ('R', 'G', 'B'))
 
         for i in files:
-            img = Image.open(i)
-
             if mode == "ALL":
-                # Use PIL's built-in Brightness enhancer for overall brightness.
-                enhancer = ImageEnhance.Brightness(img)
-                img_output = enhancer.enhance(factor)
-                # Save the balanced image.
-                filename = pathlib.Path(i).stem + "_balanced" + pathlib.Path(i).suffix
-                output_path = pathlib.Path(output_dir) / filename
-                img_output.save(output_path)
+                self.balance_file(i, output_dir, brightness=factor)
             else:
-                # Manual channel balancing for R, G, or B.
-                # Ensure image is in RGB mode for consistent indexing.
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-
-                pixels = img.load()
-                width, height = img.size
-                # Map mode ('R', 'G', 'B') to the corresponding index (0, 1, 2).
-                channel_index = {'R': 0, 'G': 1, 'B': 2}.get(mode)
-
-                for x in range(width):
-                    for y in range(height):
-                        current_color = list(pixels[x, y])
-                        # Calculate the new channel value.
-                        new_value = int(current_color[channel_index] * factor)
-                        # Clamp the new value between 0 and 255.
-                        current_color[channel_index] = max(0, min(255, new_value))
-                        # Update the pixel color.
-                        pixels[x, y] = tuple(current_color)
-
-                # Save the balanced image.
-                filename = pathlib.Path(i).stem + "_balanced" + pathlib.Path(i).suffix
-                output_path = pathlib.Path(output_dir) / filename
-                img.save(output_path)
+                self.balance_file(i, output_dir, factors)
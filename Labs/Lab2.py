@@ -1,12 +1,109 @@
-from PIL import Image, ImageEnhance
-from Common import Service
+from PIL import Image, ImageChops, ImageEnhance
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from Common import Service, load_image, save_image, ALL_IMAGE_FORMATS_MAP
+from Timing import timer
+import json
+import math
+import os
 import pathlib
+import Tiles
 
 
 class Lab2Processor:
     def __init__(self):
         self.service = Service()
 
+    def set_alpha(self, img, alpha_factor, scale=False):
+        """
+        Sets the alpha channel of an image to 'alpha_factor' (0.0 - 1.0) and returns an RGBA image.
+        With 'scale' the existing alpha is multiplied by 'alpha_factor' instead of being overwritten.
+        """
+        # Convert to RGBA
+        with timer.stage("convert"):
+            img = img.convert("RGBA")
+
+        # Change only ALPHA chanel!!! Both paths run in C, without a Python object per pixel.
+        if scale:
+            img.putalpha(img.getchannel('A').point(lambda v: int(v * alpha_factor)))
+        else:
+            img.putalpha(int(255 * alpha_factor))
+        return img
+
+    def alpha_gradient(self, size, gradient='linear', start=1.0, end=0.0, direction='H'):
+        """
+        Builds an 'L' alpha layer of 'size' going from 'start' to 'end' (0.0 - 1.0).
+        'linear' runs left to right ('H') or top to bottom ('V'), 'radial' runs from the center to the corners.
+        """
+        width, height = size
+        if gradient == 'linear':
+            length = width if direction == 'H' else height
+            ramp = np.linspace(start, end, length, dtype=np.float32) * 255
+            # One row (or column) is enough, broadcasting repeats it over the image.
+            ramp = ramp[np.newaxis, :] if direction == 'H' else ramp[:, np.newaxis]
+            alpha = np.broadcast_to(ramp, (height, width))
+        elif gradient == 'radial':
+            y, x = np.ogrid[:height, :width]
+            dx = (x.astype(np.float32) - (width - 1) / 2) ** 2
+            dy = (y.astype(np.float32) - (height - 1) / 2) ** 2
+            # Distance from the center, 0 in the middle and 1 in the corners.
+            distance = np.sqrt(dx + dy) / max(np.hypot((width - 1) / 2, (height - 1) / 2), 1)
+            alpha = (start + (end - start) * distance) * 255
+        else:
+            raise ValueError(f"Unknown gradient '{gradient}', use 'linear' or 'radial'")
+        return Image.fromarray(np.clip(alpha, 0, 255).astype(np.uint8), 'L')
+
+    def luminance_mask(self, mask, size):
+        """
+        Returns the luminance of 'mask' (an image or a path to one) as an 'L' alpha layer of 'size'.
+        """
+        if not isinstance(mask, Image.Image):
+            mask = Image.open(mask)
+        with timer.stage("convert"):
+            mask = mask.convert('L')
+        if mask.size != tuple(size):
+            mask = mask.resize(size)
+        return mask
+
+    def set_alpha_mask(self, img, gradient=None, start=1.0, end=0.0, direction='H', mask=None, scale=False):
+        """
+        Sets the alpha channel of an image from a gradient (see alpha_gradient) or from the luminance
+        of another image ('mask') and returns an RGBA image. With 'scale' the existing alpha is
+        multiplied by the layer instead of being overwritten.
+        """
+        with timer.stage("convert"):
+            img = img.convert("RGBA")
+
+        if mask is not None:
+            layer = self.luminance_mask(mask, img.size)
+        else:
+            layer = self.alpha_gradient(img.size, gradient or 'linear', start, end, direction)
+
+        if scale:
+            layer = ImageChops.multiply(img.getchannel('A'), layer)
+        img.putalpha(layer)
+        return img
+
+    @timer.timed
+    def transparency_file(self, path, output_dir, alpha_factor=1.0, scale=False, gradient=None, end_factor=0.0,
+                          direction='H', mask=None):
+        """
+        Sets the alpha channel of one image file and returns the output path.
+        Without 'gradient' and 'mask' the alpha is constant; with 'gradient' ('linear' or 'radial')
+        it goes from 'alpha_factor' to 'end_factor', and 'mask' takes it from another image's luminance.
+        """
+        img = load_image(path)
+        if gradient is None and mask is None:
+            img = self.set_alpha(img, alpha_factor, scale)
+        else:
+            img = self.set_alpha_mask(img, gradient, alpha_factor, end_factor, direction, mask, scale)
+
+        filename = pathlib.Path(path).stem + "_transparent" + ".png"  # Save in PNG for transparency
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(img, output_path)
+        print(f"Image {filename} saved with transparency.")
+        return output_path
+
     def add_transparency(self):
         """
         Add or change alpha chanel in image.
@@ -14,102 +111,552 @@ class Lab2Processor:
         files = self.service.get_images()
         output_dir = self.service.get_output_dir()
 
+        print("1. Same alpha for the whole image")
+        print("2. Linear gradient")
+        print("3. Radial gradient (from the center to the corners)")
+        print("4. Mask from the luminance of another image")
+        choice = input("Choose alpha type: ").strip()
+
+        params = {}
         try:
-            alpha_factor = float(input("Input alpha 0.0(fully transparent) to 1.0 (not transparent): "))
-            if not 0.0 <= alpha_factor <= 1.0:
-                raise ValueError
+            if choice == '4':
+                print("Choose the mask image.")
+                masks = self.service.get_images()
+                if not masks:
+                    return
+                params["mask"] = masks[0]
+            else:
+                alpha_factor = float(input("Input alpha 0.0(fully transparent) to 1.0 (not transparent): "))
+                if not 0.0 <= alpha_factor <= 1.0:
+                    raise ValueError
+                params["alpha_factor"] = alpha_factor
+
+                if choice in ('2', '3'):
+                    end_factor = float(input("Input end alpha 0.0 to 1.0: "))
+                    if not 0.0 <= end_factor <= 1.0:
+                        raise ValueError
+                    params["end_factor"] = end_factor
+                    params["gradient"] = 'linear' if choice == '2' else 'radial'
+                if choice == '2':
+                    params["direction"] = input("Direction: Horizontal (H) or Vertical (V)? ").upper()
         except ValueError:
             print("Wrong value! Input number from 0.0(not transparent) to 1.0 (fully transparent).")
             return
 
+        params["scale"] = input("Scale the existing alpha instead of replacing it? (Y/N): ").strip().upper() == 'Y'
+
         for i in files:
-            img = Image.open(i)
+            self.transparency_file(i, output_dir, **params)
 
-            # Convert to RGBA
-            img = img.convert("RGBA")
+    def input_box(self):
+        """
+        Asks the user for the (left, upper, right, lower) borders of a rectangle.
+        """
+        left = int(input("Input left border (x1): "))
+        upper = int(input("Input upper border (y1): "))
+        right = int(input("Input right border (must be bigger then left) (x2): "))
+        lower = int(input("Input lower border (must be bigger then upper) (y2): "))
+        return left, upper, right, lower
 
-            # Get pixels
-            pixels = img.getdata()
+    def load_crop_spec(self, spec):
+        """
+        Returns [(name, box)] from a crop spec: a list of boxes or a path to a spec file.
+        A .json spec holds a list of [left, upper, right, lower] boxes or {"name": ..., "box": [...]} objects;
+        any other file has one 'left upper right lower [name]' line per box (commas allowed, '#' starts a comment).
+        Boxes without a name are numbered from 1.
+        """
+        if isinstance(spec, (str, os.PathLike)):
+            path = pathlib.Path(spec)
+            with open(path, encoding="utf-8") as f:
+                if path.suffix.lower() == '.json':
+                    entries = json.load(f)
+                else:
+                    entries = []
+                    for line in f:
+                        fields = line.split('#', 1)[0].replace(',', ' ').split()
+                        if fields:
+                            entries.append({"box": [int(v) for v in fields[:4]], "name": " ".join(fields[4:]) or None})
+        else:
+            entries = spec
+
+        crops = []
+        for number, entry in enumerate(entries, start=1):
+            if isinstance(entry, dict):
+                name, box = entry.get("name") or str(number), entry["box"]
+            else:
+                name, box = str(number), entry
+            left, upper, right, lower = (int(v) for v in box)
+            if right <= left or lower <= upper:
+                raise ValueError(f"Crop box {name} is empty: {box}")
+            crops.append((name, (left, upper, right, lower)))
+        return crops
+
+    def crop(self, img, box):
+        """
+        Crops an image to the (left, upper, right, lower) box.
+        """
+        return img.crop(tuple(box))
 
-            new_pixels = []
-            for item in pixels:  # item = (R, G, B, A)
-                # Change only ALPHA chanel!!!
-                new_pixels.append((item[0], item[1], item[2], int(255 * alpha_factor)))
+    def crop_regions(self, path, boxes):
+        """
+        Yields the crop of every box from one open file. Only the tiles, strips or scanline ranges that overlap
+        a box are decoded where the format allows it (TIFF, compressed or not, BMP, PPM);
+        other formats (JPEG, PNG, ...) are decoded once for all boxes.
+        """
+        with Tiles.RegionReader(path) as reader:
+            if not reader.supports_regions:
+                print(f"{reader.format} can't be read by regions, decoding {pathlib.Path(path).name} once.")
+            for box in boxes:
+                with timer.stage("decode"):
+                    region = reader.read(box)
+                # Yield outside the stage: the caller's work on the crop isn't decoding.
+                yield region
+
+    @timer.timed
+    def crop_file(self, path, output_dir, box):
+        """
+        Crops one image file to 'box' and returns the output path.
+        """
+        cropped_img = next(self.crop_regions(path, [box]))
 
-            img.putdata(new_pixels)
+        filename = pathlib.Path(path).stem + "_cropped" + pathlib.Path(path).suffix
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(cropped_img, output_path)
+        print(f"Cropped image save as {filename}.")
+        return output_path
 
-            filename = pathlib.Path(i).stem + "_transparent" + ".png"  # Save in PNG for transparency
-            output_path = pathlib.Path(output_dir) / filename
-            img.save(output_path)
-            print(f"Image {filename} saved with transparency.")
+    @timer.timed
+    def crop_spec_file(self, path, output_dir, spec):
+        """
+        Cuts every box of a crop spec (see load_crop_spec) out of one image file and returns the output paths.
+        """
+        crops = self.load_crop_spec(spec)
+        stem, suffix = pathlib.Path(path).stem, pathlib.Path(path).suffix
+
+        output_paths = []
+        for (name, _), cropped_img in zip(crops, self.crop_regions(path, [box for _, box in crops])):
+            output_path = pathlib.Path(output_dir) / f"{stem}_crop_{name}{suffix}"
+            save_image(cropped_img, output_path)
+            output_paths.append(output_path)
+        print(f"{len(output_paths)} crop(s) of {pathlib.Path(path).name} saved.")
+        return output_paths
+
+    def input_spec(self):
+        """
+        Asks whether crop boxes come from a spec file and returns its path, or None for manual input.
+        """
+        if input("Read crop boxes from a spec file? (Y/N): ").strip().upper() != 'Y':
+            return None
+        return input("Path to the spec file (.json or text with 'left upper right lower [name]' lines): ").strip()
 
     def crop_image(self):
         files = self.service.get_images()
         output_dir = self.service.get_output_dir()
 
+        spec = self.input_spec()
         for i in files:
-            img = Image.open(i)
-            width, height = img.size
+            if spec:
+                try:
+                    self.crop_spec_file(i, output_dir, spec)
+                except Exception as e:
+                    print(f"Failed to crop {i}: {e}")
+                continue
+
+            with Image.open(i) as img:
+                width, height = img.size
             print(f"Image size: {width}x{height}.")
 
-            left = int(input("Input left border (x1): "))
-            upper = int(input("Input upper border (y1): "))
-            right = int(input("Input right border (must be bigger then left) (x2): "))
-            lower = int(input("Input lower border (must be bigger then upper) (y2): "))
+            self.crop_file(i, output_dir, self.input_box())
 
-            cropped_img = img.crop((left, upper, right, lower))
+    def cut_out(self, img, box):
+        """
+        Makes the (left, upper, right, lower) box of an image transparent and returns an RGBA image.
+        """
+        with timer.stage("convert"):
+            img = img.convert("RGBA")
+        left, upper, right, lower = box
+
+        transparent_rect = Image.new('RGBA', (right - left, lower - upper), (0, 0, 0, 0))
+        img.paste(transparent_rect, (left, upper))
+        return img
 
-            filename = pathlib.Path(i).stem + "_cropped" + pathlib.Path(i).suffix
-            output_path = pathlib.Path(output_dir) / filename
-            cropped_img.save(output_path)
-            print(f"Cropped image save as {filename}.")
+    @timer.timed
+    def invert_crop_file(self, path, output_dir, box=None, spec=None):
+        """
+        Makes the 'box' area, or every box of a crop spec (see load_crop_spec), of one image file
+        transparent and returns the output path. The output keeps every other pixel, so the file
+        is decoded as a whole, but only once for all boxes.
+        """
+        if spec is not None:
+            boxes = [box for _, box in self.load_crop_spec(spec)]
+            if not boxes:
+                raise ValueError(f"Crop spec {spec} has no boxes")
+        elif box is not None:
+            boxes = [box]
+        else:
+            raise ValueError("invert_crop_file needs a box or a crop spec")
+        img = self.cut_out(load_image(path), boxes[0])
+        for left, upper, right, lower in boxes[1:]:
+            # Already RGBA, so the other holes are pasted in place.
+            img.paste((0, 0, 0, 0), (left, upper, right, lower))
+
+        filename = pathlib.Path(path).stem + "_inverted_crop" + ".png"
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(img, output_path)
+        print(f"Saved with cropped area as {filename}.")
+        return output_path
 
     def invert_crop(self):
         files = self.service.get_images()
         output_dir = self.service.get_output_dir()
 
+        spec = self.input_spec()
         for i in files:
-            img = Image.open(i).convert("RGBA")
-            width, height = img.size
+            if spec:
+                try:
+                    self.invert_crop_file(i, output_dir, spec=spec)
+                except Exception as e:
+                    print(f"Failed to crop {i}: {e}")
+                continue
+
+            with Image.open(i) as img:
+                width, height = img.size
             print(f"Image size: {width}x{height}.")
 
-            left = int(input("Input left border (x1): "))
-            upper = int(input("Input upper border (y1): "))
-            right = int(input("Input right border (must be bigger then left) (x2): "))
-            lower = int(input("Input lower border (must be bigger then upper) (y2): "))
+            self.invert_crop_file(i, output_dir, self.input_box())
 
-            transparent_rect = Image.new('RGBA', (right - left, lower - upper), (0, 0, 0, 0))
-            img.paste(transparent_rect, (left, upper))
+    @timer.timed
+    def slice_file(self, path, output_dir, parts, rows=1):
+        """
+        Cuts one image file into 'parts' vertical strips, or into a grid of 'parts' columns
+        and 'rows' rows, and returns the list of output paths.
+        """
+        img = load_image(path)
+        width, height = img.size
+        part_width = width // parts
+        part_height = height // rows
 
-            filename = pathlib.Path(i).stem + "_inverted_crop" + ".png"
-            output_path = pathlib.Path(output_dir) / filename
-            img.save(output_path)
-            print(f"Saved with cropped area as {filename}.")
+        output_paths = []
+        for r in range(rows):
+            for j in range(parts):
+                left = j * part_width
+                upper = r * part_height
+                right = (j + 1) * part_width
+                lower = (r + 1) * part_height if rows > 1 else height
+
+                box = (left, upper, right, lower)
+                part = img.crop(box)
+
+                # Strips keep their old names, grid cells are named by row and column.
+                number = f"{j + 1}" if rows == 1 else f"{r + 1}_{j + 1}"
+                filename = f"{pathlib.Path(path).stem}_part_{number}{pathlib.Path(path).suffix}"
+                output_path = pathlib.Path(output_dir) / filename
+                save_image(part, output_path)
+                print(f"Part {number} saved as {filename}.")
+                output_paths.append(output_path)
+        return output_paths
 
     def slice_image(self):
         files = self.service.get_images()
         output_dir = self.service.get_output_dir()
 
         parts = int(input("How many parts to divide horizontally into?? "))
+        rows = int(input("How many rows (1 for vertical strips)? ") or 1)
 
         for i in files:
-            img = Image.open(i)
+            self.slice_file(i, output_dir, parts, rows)
+
+    def pyramid_levels(self, img):
+        """
+        Yields (level, image) from the full resolution down to 1x1 pixel, as in Deep Zoom:
+        level 'max' is the original and every level below is half the size (rounded up).
+        Each level is downsampled from the previous one, so every pixel is averaged only once per level.
+        """
+        level = math.ceil(math.log2(max(img.size))) if max(img.size) > 1 else 0
+        yield level, img
+        while level > 0:
+            # reduce() is a 2x2 box average in C and rounds odd sizes up, like Deep Zoom levels.
+            img = img.reduce(2)
+            level -= 1
+            yield level, img
+
+    def grid_boxes(self, size, tile_size, overlap=0):
+        """
+        Returns [(column, row, box)] of a grid of 'tile_size' tiles over an image of 'size'.
+        Every tile is extended by 'overlap' pixels on the sides that have a neighbour.
+        """
+        width, height = size
+        boxes = []
+        for row in range(math.ceil(height / tile_size)):
+            for column in range(math.ceil(width / tile_size)):
+                left = max(column * tile_size - overlap, 0)
+                upper = max(row * tile_size - overlap, 0)
+                right = min((column + 1) * tile_size + overlap, width)
+                lower = min((row + 1) * tile_size + overlap, height)
+                boxes.append((column, row, (left, upper, right, lower)))
+        return boxes
+
+    @timer.timed
+    def pyramid_file(self, path, output_dir, tile_size=256, overlap=0, layout='dzi', tile_format='png',
+                     workers=None):
+        """
+        Exports one image file as a multi-resolution tile pyramid for tile viewers and returns the manifest path.
+        'dzi' writes {stem}.dzi with tiles in {stem}_files/{level}/{column}_{row}.{format} (Deep Zoom);
+        'xyz' writes {stem}/{z}/{x}/{y}.{format} plus {stem}/manifest.json, where z = 0 is the smallest level.
+        The file is decoded once and the tiles of each level are encoded on 'workers' threads.
+        """
+        if layout not in ('dzi', 'xyz'):
+            raise ValueError(f"Unknown layout '{layout}', use 'dzi' or 'xyz'")
+        extension = ALL_IMAGE_FORMATS_MAP[tile_format]
+        # PIL prefers 'jpeg' over 'jpg' for saving.
+        tile_format = 'jpeg' if tile_format == 'jpg' else tile_format
+        stem = pathlib.Path(path).stem
+
+        img = load_image(path)
+        # Decode before the pool starts: the tile threads crop the same image, and concurrent
+        # lazy loads of one file break the decoder.
+        img.load()
+        with timer.stage("convert"):
+            # reduce() needs a plain 8-bit mode and JPEG tiles can't keep alpha.
+            if tile_format == 'jpeg':
+                img = img.convert('RGB' if img.mode != 'L' else 'L')
+            elif img.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+                img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+
+        if layout == 'dzi':
+            tiles_dir = pathlib.Path(output_dir) / f"{stem}_files"
+            manifest_path = pathlib.Path(output_dir) / f"{stem}.dzi"
+        else:
+            tiles_dir = pathlib.Path(output_dir) / stem
+            manifest_path = tiles_dir / "manifest.json"
+
+        levels = []
+        workers = workers or os.cpu_count() or 1
+        # Threads share the level image; Pillow encoders release the GIL, so tiles are encoded in parallel.
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for level, level_img in self.pyramid_levels(img):
+                boxes = self.grid_boxes(level_img.size, tile_size, overlap)
+                columns = math.ceil(level_img.width / tile_size)
+                levels.append({"level": level, "width": level_img.width, "height": level_img.height,
+                               "columns": columns, "rows": math.ceil(level_img.height / tile_size)})
+
+                # Both layouts number levels the same way, 0 is the 1x1 level.
+                if layout == 'dzi':
+                    (tiles_dir / str(level)).mkdir(parents=True, exist_ok=True)
+                    names = [pathlib.Path(str(level), f"{column}_{row}{extension}") for column, row, _ in boxes]
+                else:
+                    for column in range(columns):
+                        (tiles_dir / str(level) / str(column)).mkdir(parents=True, exist_ok=True)
+                    names = [pathlib.Path(str(level), str(column), f"{row}{extension}") for column, row, _ in boxes]
+
+                def save_tile(job, level_img=level_img):
+                    (_, _, box), name = job
+                    # Plain save: the shared timer is not thread-safe, the whole level is timed as 'encode' below.
+                    level_img.crop(box).save(tiles_dir / name, format=tile_format)
+
+                with timer.stage("encode"):
+                    # list() waits for the level and re-raises the first failed tile.
+                    list(pool.map(save_tile, zip(boxes, names)))
+
+        if layout == 'dzi':
             width, height = img.size
-            part_width = width // parts
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                        f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" '
+                        f'Overlap="{overlap}" Format="{extension.lstrip(".")}">\n'
+                        f'  <Size Width="{width}" Height="{height}"/>\n'
+                        '</Image>\n')
+        else:
+            with open(manifest_path, "w", encoding="utf-8") as f:
+                json.dump({"width": img.width, "height": img.height, "tile_size": tile_size, "overlap": overlap,
+                           "format": extension.lstrip("."), "min_zoom": 0, "max_zoom": levels[0]["level"],
+                           "levels": sorted(levels, key=lambda l: l["level"])}, f, indent=2)
+
+        tiles = sum(level["columns"] * level["rows"] for level in levels)
+        print(f"Pyramid of {len(levels)} level(s), {tiles} tile(s) saved as {manifest_path.name}.")
+        return manifest_path
+
+    def create_pyramid(self):
+        """
+        Exports the chosen images as deep-zoom tile pyramids.
+        """
+        files = self.service.get_images()
+        output_dir = self.service.get_output_dir()
 
-            for j in range(parts):
-                left = j * part_width
-                upper = 0
-                right = (j + 1) * part_width
-                lower = height
+        try:
+            tile_size = int(input("Tile size in pixels (e.g. 256): ") or 256)
+            overlap = int(input("Tile overlap in pixels (e.g. 0 or 1): ") or 0)
+        except ValueError:
+            print("Wrong value!")
+            return
+        layout = input("Layout: Deep Zoom (DZI) or z/x/y folders (XYZ)? ").strip().lower() or 'dzi'
+        tile_format = input("Tile format (png or jpg): ").strip().lower() or 'png'
 
-                box = (left, upper, right, lower)
-                part = img.crop(box)
+        for i in files:
+            try:
+                self.pyramid_file(i, output_dir, tile_size, overlap, layout, tile_format)
+            except Exception as e:
+                print(f"Failed to build the pyramid of {i}: {e}")
 
-                filename = f"{pathlib.Path(i).stem}_part_{j + 1}{pathlib.Path(i).suffix}"
-                output_path = pathlib.Path(output_dir) / filename
-                part.save(output_path)
-                print(f"Part {j + 1} saved as {filename}.")
+    def change_contrast(self, img, factor):
+        """
+        Changes the contrast of an image by 'factor'.
+        """
+        # Object which works with contrast
+        enhancer = ImageEnhance.Contrast(img)
+
+        # Applies changes
+        return enhancer.enhance(factor)
+
+    def on_luminance(self, img, func):
+        """
+        Applies 'func' ('L' image -> 'L' image) to the luminance of an image and keeps its colors and alpha.
+        Color images go through YCbCr, so only brightness is remapped and hues don't shift.
+        """
+        if img.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+            # Palette, CMYK, 1-bit and 16/32-bit images are brought to a plain 8-bit mode first.
+            with timer.stage("convert"):
+                if img.mode in ('1', 'I', 'I;16', 'F'):
+                    img = img.convert('L')
+                else:
+                    img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+        if img.mode == 'L':
+            return func(img)
+
+        if img.mode == 'LA':
+            result = func(img.getchannel('L'))
+        else:
+            with timer.stage("convert"):
+                y, cb, cr = img.convert('YCbCr').split()
+            y = func(y)
+            with timer.stage("convert"):
+                result = Image.merge('YCbCr', (y, cb, cr)).convert('RGB')
+        if 'A' in img.mode:
+            result = Image.merge(img.mode, (*result.split(), img.getchannel('A')))
+        return result
+
+    def equalize_lut(self, histogram):
+        """
+        Returns the 256-entry LUT that spreads a 256-bin histogram evenly over 0-255.
+        """
+        cdf = np.cumsum(histogram, dtype=np.float64)
+        # Start the mapping at the first occupied level, so the darkest pixels become 0.
+        cdf_min = cdf[np.nonzero(histogram)[0][0]] if cdf[-1] else 0
+        scale = 255 / max(cdf[-1] - cdf_min, 1)
+        return np.clip(np.round((cdf - cdf_min) * scale), 0, 255).astype(np.uint8)
+
+    def equalize(self, img):
+        """
+        Global histogram equalization of the image luminance.
+        """
+        def equalize_l(gray):
+            # histogram() and point() both run in C, the LUT itself has only 256 entries.
+            return gray.point(self.equalize_lut(gray.histogram()).tolist())
+        return self.on_luminance(img, equalize_l)
+
+    def clahe(self, img, clip_limit=2.0, grid=8):
+        """
+        Contrast limited adaptive histogram equalization (CLAHE) of the image luminance.
+        The image is split into 'grid' x 'grid' tiles (fewer for tiny images); every tile gets its own
+        equalization LUT with the histogram clipped at 'clip_limit' times the mean bin height, and pixels
+        interpolate bilinearly between the LUTs of the four nearest tile centers.
+        Both settings are relative to the image size, so one choice works for a batch of mixed images.
+        """
+        return self.on_luminance(img, lambda gray: self._clahe_l(gray, clip_limit, grid))
+
+    def _clahe_l(self, gray, clip_limit, grid):
+        values = np.asarray(gray)
+        height, width = values.shape
+        rows, columns = min(grid, height), min(grid, width)
+        tile_h, tile_w = math.ceil(height / rows), math.ceil(width / columns)
+
+        # Pad to whole tiles with the edge pixels and count every tile with bincount.
+        padded = np.pad(values, ((0, rows * tile_h - height), (0, columns * tile_w - width)), mode='edge')
+        tiles = padded.reshape(rows, tile_h, columns, tile_w).transpose(0, 2, 1, 3).reshape(rows * columns, -1)
+        histograms = np.stack([np.bincount(tile, minlength=256) for tile in tiles])
+
+        # Clip every histogram and share the clipped counts evenly between all bins.
+        limit = max(clip_limit * tile_h * tile_w / 256, 1)
+        excess = np.maximum(histograms - limit, 0).sum(axis=1, keepdims=True)
+        histograms = np.minimum(histograms, limit) + excess / 256
+
+        cdf = np.cumsum(histograms, axis=1)
+        luts = (cdf * (255 / cdf[:, -1:])).astype(np.float32).reshape(rows, columns, 256)
+
+        # Position of every column between the two nearest tile centers.
+        x = (np.arange(width, dtype=np.float32) + 0.5) / tile_w - 0.5
+        x0 = np.clip(np.floor(x), 0, columns - 1).astype(np.intp)
+        x1 = np.minimum(x0 + 1, columns - 1)
+        fx = np.clip(x - x0, 0, 1).astype(np.float32)[:, None]
+        y = (np.arange(height, dtype=np.float32) + 0.5) / tile_h - 0.5
+        y0 = np.clip(np.floor(y), 0, rows - 1).astype(np.intp)
+        fy = np.clip(y - y0, 0, 1).astype(np.float32)
+
+        result = np.empty_like(values)
+        column_offsets = np.arange(width) * 256
+        # Work in chunks of rows that fit in cache, with buffers reused for every chunk.
+        chunk = max(1, 262144 // width)
+        index = np.empty((chunk, width), dtype=np.intp)
+        upper_values = np.empty((chunk, width), dtype=np.float32)
+        lower_values = np.empty((chunk, width), dtype=np.float32)
+
+        start = 0
+        while start < height:
+            # Rows between the same two tile-center rows share their LUT pair.
+            top = y0[start]
+            band_end = start + np.searchsorted(y0[start:], top, side='right')
+            bottom = min(top + 1, rows - 1)
+            # Interpolate horizontally once per band: a (width, 256) LUT for the upper and lower tile row.
+            upper = ((1 - fx) * luts[top, x0] + fx * luts[top, x1]).ravel()
+            lower = ((1 - fx) * luts[bottom, x0] + fx * luts[bottom, x1]).ravel()
+
+            for chunk_start in range(start, band_end, chunk):
+                n = min(chunk, band_end - chunk_start)
+                np.add(column_offsets, values[chunk_start:chunk_start + n], out=index[:n])
+                u, l = upper_values[:n], lower_values[:n]
+                np.take(upper, index[:n], out=u)
+                np.take(lower, index[:n], out=l)
+                # Vertical interpolation in place: u + (l - u) * fy.
+                l -= u
+                l *= fy[chunk_start:chunk_start + n, None]
+                u += l
+                # LUT values stay within 0-255, so rounding needs no clipping.
+                u += 0.5
+                result[chunk_start:chunk_start + n] = u
+            start = band_end
+        return Image.fromarray(result, 'L')
+
+    @timer.timed
+    def auto_contrast_file(self, path, output_dir, method='equalize', clip_limit=2.0, grid=8):
+        """
+        Applies automatic contrast ('equalize' or 'clahe') to one image file and returns the output path.
+        """
+        img = load_image(path)
+        if method == 'equalize':
+            img_enhanced = self.equalize(img)
+        elif method == 'clahe':
+            img_enhanced = self.clahe(img, clip_limit, grid)
+        else:
+            raise ValueError(f"Unknown contrast method '{method}', use 'equalize' or 'clahe'")
+
+        filename = pathlib.Path(path).stem + f"_{method}" + pathlib.Path(path).suffix
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(img_enhanced, output_path)
+        print(f"Changed image saved as {filename}.")
+        return output_path
+
+    @timer.timed
+    def contrast_file(self, path, output_dir, factor):
+        """
+        Changes the contrast of one image file and returns the output path.
+        """
+        img_enhanced = self.change_contrast(load_image(path), factor)
+
+        filename = pathlib.Path(path).stem + "_contrasted" + pathlib.Path(path).suffix
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(img_enhanced, output_path)
+        print(f"Changed image saved as {filename}.")
+        return output_path
 
     def enhance_contrast(self):
         """
@@ -118,6 +665,24 @@ class Lab2Processor:
         files = self.service.get_images()
         output_dir = self.service.get_output_dir()
 
+        print("1. Manual coefficient")
+        print("2. Automatic: histogram equalization")
+        print("3. Automatic: adaptive equalization (CLAHE)")
+        choice = input("Choose contrast mode: ").strip()
+
+        if choice in ('2', '3'):
+            params = {"method": 'equalize' if choice == '2' else 'clahe'}
+            if choice == '3':
+                try:
+                    params["clip_limit"] = float(input("Clip limit (e.g. 2.0, higher means stronger contrast): ") or 2.0)
+                    params["grid"] = int(input("Tiles per side (e.g. 8): ") or 8)
+                except ValueError:
+                    print("Wrong value!")
+                    return
+            for i in files:
+                self.auto_contrast_file(i, output_dir, **params)
+            return
+
         try:
             factor = float(input("Input contrast coefficient (For example, 1.5 for 50% increase): "))
         except ValueError:
@@ -125,15 +690,4 @@ class Lab2Processor:
             return
 
         for i in files:
-            img = Image.open(i)
-
-            # Object which works with contrast
-            enhancer = ImageEnhance.Contrast(img)
-
-            # Applies changes
-            img_enhanced = enhancer.enhance(factor)
-
-            filename = pathlib.Path(i).stem + "_contrasted" + pathlib.Path(i).suffix
-            output_path = pathlib.Path(output_dir) / filename
-            img_enhanced.save(output_path)
-            print(f"Changed image saved as {filename}.")
+            self.contrast_file(i, output_dir, factor)
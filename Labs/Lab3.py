@@ -1,21 +1,253 @@
 from PIL import Image, ImageDraw, ImageFont, ImageTk
-from Common import Service, ALL_IMAGE_FORMATS_MAP, FONT_MAP
+from Batch import BatchExecutor
+from Common import Service, ALL_IMAGE_FORMATS_MAP, FONT_MAP, load_image, save_image
+from Timing import timer
+from collections import OrderedDict, deque
+import math
 import pathlib
 import os
+import threading
 import tkinter as tk
 
 
+class SlidePrefetcher:
+    """
+    Decodes slideshow images into display-size thumbnails on a background thread.
+    The next 'ahead' slides are prefetched after every request, and up to 'capacity'
+    ready thumbnails are kept in an LRU cache, so stepping back or looping around
+    shows recently seen slides without decoding them again.
+    """
+
+    def __init__(self, paths, size=(800, 600), ahead=3, capacity=16):
+        self.paths = list(paths)
+        self.size = size
+        self.ahead = ahead
+        self.capacity = max(capacity, ahead + 2)
+        # index -> thumbnail, or the exception if the file couldn't be decoded
+        self.cache = OrderedDict()
+        self.pending = deque()
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def get(self, index, step=1, loop=False):
+        """
+        Returns the thumbnail of slide 'index', waiting only if it isn't decoded yet, and prefetches
+        the next slides in the direction of 'step'. Raises the decode error of a broken file.
+        """
+        with self.condition:
+            if index not in self.cache:
+                # Jump the queue and wait for the decoder thread.
+                self.pending.appendleft(index)
+                self.condition.notify_all()
+                while index not in self.cache and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    raise RuntimeError("Slideshow stopped")
+            value = self.cache[index]
+            self.cache.move_to_end(index)
+
+            self.pending.clear()
+            for offset in range(1, self.ahead + 1):
+                following = index + offset * step
+                if loop:
+                    following %= len(self.paths)
+                if 0 <= following < len(self.paths) and following not in self.cache:
+                    self.pending.append(following)
+            self.condition.notify_all()
+
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                index = self.pending.popleft()
+                if index in self.cache:
+                    continue
+
+            # Decode without holding the lock, so the UI can keep reading the cache.
+            try:
+                value = Lab3Processor.cell_thumbnail(self.paths[index], self.size)
+            except Exception as e:
+                value = e
+
+            with self.condition:
+                self.cache[index] = value
+                while len(self.cache) > self.capacity:
+                    self.cache.popitem(last=False)
+                self.condition.notify_all()
+
+
 class Lab3Processor:
+    # Most rendered watermark texts kept for reuse.
+    GLYPH_CACHE_SIZE = 64
+
     def __init__(self):
         self.service = Service()
+        # (font_choice, font_size) -> loaded ImageFont
+        self.fonts = {}
+        # (text, font, color) -> (RGBA text layer cropped to its bbox, bbox)
+        self.glyphs = {}
+
+    def join_images(self, img1, img2, direction):
+        """
+        Joins two images horizontally ('H') or vertically ('V') into one RGB image.
+        """
+        # Convert to RGB to avoid transparency issues
+        with timer.stage("convert"):
+            img1 = img1.convert('RGB')
+            img2 = img2.convert('RGB')
+
+        w1, h1 = img1.size
+        w2, h2 = img2.size
+
+        if direction == 'H':
+            # Horizontal combination
+            new_width = w1 + w2
+            new_height = max(h1, h2)
+            new_img = Image.new('RGB', (new_width, new_height))
+            new_img.paste(img1, (0, 0))
+            new_img.paste(img2, (w1, 0))
+
+        else:  # direction == 'V'
+            # Vertical combination
+            new_width = max(w1, w2)
+            new_height = h1 + h2
+            new_img = Image.new('RGB', (new_width, new_height))
+            new_img.paste(img1, (0, 0))
+            new_img.paste(img2, (0, h1))
+        return new_img
+
+    @timer.timed
+    def combine_files(self, paths, output_dir, direction):
+        """
+        Combines two image files horizontally ('H') or vertically ('V') and returns the output path.
+        """
+        new_img = self.join_images(load_image(paths[0]), load_image(paths[1]), direction)
+
+        # Create output filename
+        stem1 = pathlib.Path(paths[0]).stem
+        stem2 = pathlib.Path(paths[1]).stem
+        filename = f"{stem1}_{stem2}_combined.png"  # Save as PNG
+        output_path = pathlib.Path(output_dir) / filename
+
+        save_image(new_img, output_path)
+        print(f"Combined image saved as {filename}")
+        return output_path
+
+    @staticmethod
+    def cell_thumbnail(path, cell_size, background=(255, 255, 255)):
+        """
+        Decodes one image file straight to a thumbnail that fits into 'cell_size' x 'cell_size'
+        (or into a (width, height) box).
+        JPEG files are draft-decoded at a reduced scale, so a full-size copy is never made for them.
+        Transparency is flattened onto 'background'. Returns an RGB image.
+        """
+        with Image.open(path) as img:
+            if img.mode not in ('RGB', 'RGBA', 'L'):
+                # Palette and other special modes would be resized with NEAREST.
+                with timer.stage("convert"):
+                    img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+            # thumbnail() calls draft() and reduces by an integer factor before the final resample.
+            box = cell_size if isinstance(cell_size, tuple) else (cell_size, cell_size)
+            img.thumbnail(box, Image.Resampling.LANCZOS)
+
+            if img.mode == 'RGBA':
+                flat = Image.new('RGB', img.size, tuple(background))
+                flat.paste(img, mask=img.getchannel('A'))
+                return flat
+            return img.convert('RGB')
+
+    def mosaic_size(self, count, layout='grid', columns=None):
+        """
+        Returns (columns, rows) of a mosaic of 'count' cells.
+        'grid' is close to square unless 'columns' is given, 'row' is one row and 'column' is one column.
+        """
+        if layout == 'row':
+            return count, 1
+        if layout == 'column':
+            return 1, count
+        columns = columns or math.ceil(math.sqrt(count))
+        return columns, math.ceil(count / columns)
+
+    @timer.timed
+    def mosaic_files(self, paths, output_dir, layout='grid', columns=None, cell_size=256, padding=4,
+                     background=(255, 255, 255), workers=None, filename="contact_sheet.png"):
+        """
+        Builds a contact sheet of any number of image files: a grid, one row or one column
+        of 'cell_size' cells, every image centered in its cell. Returns the output path.
+        Inputs are decoded and thumbnailed on a process pool, and each thumbnail is pasted
+        into the canvas as soon as it arrives, so memory stays near one canvas plus a few inputs.
+        """
+        if not paths:
+            raise ValueError("No images to combine")
+        columns, rows = self.mosaic_size(len(paths), layout, columns)
+        step = cell_size + padding
+        canvas = Image.new('RGB', (columns * step + padding, rows * step + padding), tuple(background))
+
+        # The executor keeps only a small window of thumbnails in flight and yields them in order.
+        executor = BatchExecutor(workers)
+        items = ((path, cell_size, tuple(background)) for path in paths)
+        for index, result in enumerate(executor.map(Lab3Processor.cell_thumbnail, items)):
+            if not result.ok:
+                continue
+            thumbnail = result.value
+            column, row = index % columns, index // columns
+            left = padding + column * step + (cell_size - thumbnail.width) // 2
+            upper = padding + row * step + (cell_size - thumbnail.height) // 2
+            canvas.paste(thumbnail, (left, upper))
+        executor.print_errors()
+
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(canvas, output_path)
+        print(f"Contact sheet of {len(paths) - len(executor.errors)} image(s) saved as {output_path.name}")
+        return output_path
+
+    def create_mosaic(self, files):
+        """
+        Asks for the mosaic layout and builds a contact sheet of 'files'.
+        """
+        layout = {'G': 'grid', 'R': 'row', 'C': 'column'}.get(
+            input("Layout: grid (G), one row (R) or one column (C)? ").strip().upper())
+        if layout is None:
+            print("Wrong layout. Please input 'G', 'R' or 'C'.")
+            return
+        try:
+            columns = int(input("Columns (empty for automatic): ") or 0) if layout == 'grid' else None
+            cell_size = int(input("Cell size in pixels (e.g. 256): ") or 256)
+        except ValueError:
+            print("Wrong value!")
+            return
+
+        output_dir = self.service.get_output_dir()
+        try:
+            self.mosaic_files(files, output_dir, layout, columns or None, cell_size)
+        except Exception as e:
+            print(f"An error occurred during image combining: {e}")
 
     def combine_images(self):
         """
-        Task 1: Combine two images horizontally or vertically.
+        Task 1: Combine two images horizontally or vertically, or many images into a contact sheet.
         """
-        print("Please select exactly TWO images to combine.")
+        print("Please select TWO images to combine, or more for a contact sheet.")
         files = self.service.get_images()
 
+        if len(files) > 2:
+            self.create_mosaic(files)
+            return
+
         if len(files) != 2:
             print(f"Error: You selected {len(files)} images. Please select exactly 2.")
             return
@@ -28,38 +260,7 @@ class Lab3Processor:
         output_dir = self.service.get_output_dir()
 
         try:
-            # Open and convert to RGB to avoid transparency issues
-            img1 = Image.open(files[0]).convert('RGB')
-            img2 = Image.open(files[1]).convert('RGB')
-
-            w1, h1 = img1.size
-            w2, h2 = img2.size
-
-            if direction == 'H':
-                # Horizontal combination
-                new_width = w1 + w2
-                new_height = max(h1, h2)
-                new_img = Image.new('RGB', (new_width, new_height))
-                new_img.paste(img1, (0, 0))
-                new_img.paste(img2, (w1, 0))
-
-            else:  # direction == 'V'
-                # Vertical combination
-                new_width = max(w1, w2)
-                new_height = h1 + h2
-                new_img = Image.new('RGB', (new_width, new_height))
-                new_img.paste(img1, (0, 0))
-                new_img.paste(img2, (0, h1))
-
-            # Create output filename
-            stem1 = pathlib.Path(files[0]).stem
-            stem2 = pathlib.Path(files[1]).stem
-            filename = f"{stem1}_{stem2}_combined.png"  # Save as PNG
-            output_path = pathlib.Path(output_dir) / filename
-
-            new_img.save(output_path)
-            print(f"Combined image saved as {filename}")
-
+            self.combine_files(files, output_dir, direction)
         except Exception as e:
             print(f"An error occurred during image combining: {e}")
 
@@ -69,6 +270,116 @@ class Lab3Processor:
     # Assuming 'self.service' is defined elsewhere and has
     # get_images() and get_output_dir() methods.
 
+    def load_font(self, font_choice, font_size):
+        """
+        Loads the font chosen from FONT_MAP, falling back to the default PIL font.
+        Fonts are loaded once per (choice, size) and reused afterwards.
+        """
+        key = (font_choice, font_size)
+        if key in self.fonts:
+            return self.fonts[key]
+
+        # Get the font details, default to Arial (key "1") if invalid key
+        chosen_font_tuple = FONT_MAP.get(font_choice, FONT_MAP["1"])
+        font_filename = chosen_font_tuple[1]
+        font_display_name = chosen_font_tuple[0]
+
+        try:
+            font = ImageFont.truetype(font_filename, font_size)
+            print(f"Using font: {font_display_name}")
+        except IOError:
+            print(f"{font_display_name} ({font_filename}) font not found, using default font.")
+            font = ImageFont.load_default()
+        self.fonts[key] = font
+        return font
+
+    def render_text(self, text, font, text_color):
+        """
+        Returns (layer, bbox): 'text' drawn on a transparent RGBA layer just as big as its
+        bounding box, and the bbox relative to the drawing origin. Layers are cached, so a batch
+        with one watermark renders it only once.
+        """
+        key = (text, font, tuple(text_color))
+        if key in self.glyphs:
+            return self.glyphs[key]
+
+        # Use textbbox to get precise text boundaries
+        bbox = ImageDraw.Draw(Image.new("RGBA", (1, 1))).textbbox((0, 0), text, font=font)
+        layer = Image.new("RGBA", (max(bbox[2] - bbox[0], 1), max(bbox[3] - bbox[1], 1)), (255, 255, 255, 0))
+        ImageDraw.Draw(layer).text((-bbox[0], -bbox[1]), text, font=font, fill=text_color)
+
+        if len(self.glyphs) >= self.GLYPH_CACHE_SIZE:
+            # Drop the oldest entry; dicts keep insertion order.
+            del self.glyphs[next(iter(self.glyphs))]
+        self.glyphs[key] = (layer, bbox)
+        return layer, bbox
+
+    def watermark_image(self, img, text, pos_choice, font, text_color):
+        """
+        Draws 'text' over an image at the chosen position and returns the RGBA result.
+        Only the bounding box of the text is composited, the rest of the frame is left as it is.
+        """
+        # Convert to RGBA to be able to overlay a layer with transparency
+        with timer.stage("convert"):
+            img = img.convert("RGBA")
+        width, height = img.size
+
+        # Determine the text size
+        layer, bbox = self.render_text(text, font, text_color)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+
+        # Determine the position
+        padding = 10  # Padding from the edges
+        if pos_choice == 'C':
+            x = (width - text_width) // 2
+            y = (height - text_height) // 2
+        elif pos_choice == 'BR':
+            x = width - text_width - padding
+            y = height - text_height - padding
+        elif pos_choice == 'TL':
+            x = padding
+            y = padding
+        else:  # Default to center
+            print("Invalid position, defaulting to center.")
+            x = (width - text_width) // 2
+            y = (height - text_height) // 2
+
+        # The layer starts where the text drawn at (x, y) has its first pixel.
+        left, upper = x + bbox[0], y + bbox[1]
+        # Clip the layer to the frame: alpha_composite() takes no negative positions.
+        source = (max(-left, 0), max(-upper, 0))
+        if source[0] < layer.width and source[1] < layer.height and left < width and upper < height:
+            img.alpha_composite(layer, dest=(max(left, 0), max(upper, 0)), source=source)
+        return img
+
+    def add_text(self, img, text, pos_choice='C', font_choice="1", font_size=36,
+                 opacity=128, color=(255, 255, 255), font=None):
+        """
+        Adds a text watermark to an image, loading the font by choice and size
+        unless an already loaded 'font' is passed.
+        """
+        if font is None:
+            font = self.load_font(font_choice, font_size)
+        text_color = (*color, opacity)  # Color with opacity
+        return self.watermark_image(img, text, pos_choice, font, text_color)
+
+    @timer.timed
+    def watermark_file(self, path, output_dir, text, pos_choice='C', font_choice="1", font_size=36,
+                       opacity=128, color=(255, 255, 255), font=None):
+        """
+        Adds a text watermark to one image file and returns the output path.
+        """
+        watermarked_img = self.add_text(load_image(path), text, pos_choice, font_choice, font_size,
+                                        opacity, color, font)
+
+        # Save (must be PNG to support transparency)
+        filename = pathlib.Path(path).stem + "_watermarked.png"
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(watermarked_img, output_path)
+        print(f"Watermarked image saved as {filename}")
+        return output_path
+
     def add_watermark(self):
         """
         Task 2: Add a text watermark to an image.
@@ -89,11 +400,6 @@ class Lab3Processor:
 
             # Default to "1" (Arial) if input is empty or invalid
             font_choice = input(f"Enter font choice (1-{len(FONT_MAP)}, default 1): ") or "1"
-
-            # Get the font details, default to Arial (key "1") if invalid key
-            chosen_font_tuple = FONT_MAP.get(font_choice, FONT_MAP["1"])
-            font_filename = chosen_font_tuple[1]
-            font_display_name = chosen_font_tuple[0]
             # --- END NEW ---
 
             font_size = int(input("Enter font size (e.g., 36): "))
@@ -101,65 +407,18 @@ class Lab3Processor:
             color_str = input("Enter color (R,G,B), e.g., '255,255,255': ")
 
             r, g, b = map(int, color_str.split(','))
-            text_color = (r, g, b, opacity)  # Color with opacity
+            color = (r, g, b)
 
         except ValueError:
             print("Invalid input. Please check your numbers.")
             return
 
-        # --- MODIFIED: Try to load the CHOSEN font ---
-        try:
-            font = ImageFont.truetype(font_filename, font_size)
-            print(f"Using font: {font_display_name}")
-        except IOError:
-            print(f"{font_display_name} ({font_filename}) font not found, using default font.")
-            font = ImageFont.load_default()
-        # --- END MODIFIED ---
+        # Load the CHOSEN font once for the whole batch
+        font = self.load_font(font_choice, font_size)
 
         for i in files:
             try:
-                # Convert to RGBA to be able to overlay a layer with transparency
-                img = Image.open(i).convert("RGBA")
-                width, height = img.size
-
-                # Create a separate transparent layer for the text
-                txt_layer = Image.new("RGBA", img.size, (255, 255, 255, 0))
-                draw = ImageDraw.Draw(txt_layer)
-
-                # Determine the text size
-                # Use textbbox to get precise text boundaries
-                bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-
-                # Determine the position
-                padding = 10  # Padding from the edges
-                if pos_choice == 'C':
-                    x = (width - text_width) // 2
-                    y = (height - text_height) // 2
-                elif pos_choice == 'BR':
-                    x = width - text_width - padding
-                    y = height - text_height - padding
-                elif pos_choice == 'TL':
-                    x = padding
-                    y = padding
-                else:  # Default to center
-                    print("Invalid position, defaulting to center.")
-                    x = (width - text_width) // 2
-                    y = (height - text_height) // 2
-
-                # Draw text on the transparent layer
-                draw.text((x, y), text, font=font, fill=text_color)
-
-                # Composite the original image and the text layer
-                watermarked_img = Image.alpha_composite(img, txt_layer)
-
-                # Save (must be PNG to support transparency)
-                filename = pathlib.Path(i).stem + "_watermarked.png"
-                output_path = pathlib.Path(output_dir) / filename
-                watermarked_img.save(output_path)
-                print(f"Watermarked image saved as {filename}")
-
+                self.watermark_file(i, output_dir, text, pos_choice, opacity=opacity, color=color, font=font)
             except Exception as e:
                 print(f"Failed to watermark {i}: {e}")
 
@@ -182,24 +441,36 @@ class Lab3Processor:
             delay = 2
 
         delay_ms = delay * 1000  # Convert to milliseconds for .after()
+        loop = input("Loop the slideshow? (Y/N): ").strip().upper() == 'Y'
 
         # The image_files list is already prepared,
         # so the block for searching files in a directory is no longer needed.
 
         print(f"Found {len(image_files)} images. Starting slideshow...")
+        print("Keys: Right/Space - next, Left - previous, Escape - close.")
+
+        # Thumbnails are decoded ahead on a background thread, the Tk thread only shows them.
+        prefetcher = SlidePrefetcher(image_files, (800, 600))
 
         # Setup Tkinter GUI
         root = tk.Tk()
         root.title("Slideshow")
         label = tk.Label(root)
         label.pack()
+        # Index of the current slide and the pending .after() call
+        state = {"index": 0, "after": None}
+
+        def close_slideshow():
+            prefetcher.stop()
+            root.destroy()  # 1. Destroy the window
+            root.quit()  # 2. Explicitly stop the mainloop
 
         # Use .after() instead of time.sleep() to avoid blocking the GUI
-        def update_image(index):
+        def update_image(index, step=1):
+            state["index"] = index
             img_path = image_files[index]
             try:
-                img = Image.open(img_path)
-                img.thumbnail((800, 600))
+                img = prefetcher.get(index, step, loop)
 
                 # Use 'master=root' to avoid errors
                 tk_img = ImageTk.PhotoImage(img, master=root)
@@ -209,24 +480,39 @@ class Lab3Processor:
                 print(f"Could not load image {img_path}: {e}")
 
             next_index = index + 1
+            if loop:
+                next_index %= len(image_files)
 
             # Check if there are more images in the list
             if next_index < len(image_files):
                 # If yes, schedule the next image
-                root.after(delay_ms, update_image, next_index)
+                state["after"] = root.after(delay_ms, update_image, next_index)
             else:
                 # If no (this was the last image),
                 # wait for the same delay and close the window
                 print("Slideshow finished.")
-
-                def close_slideshow():
-                    root.destroy()  # 1. Destroy the window
-                    root.quit()  # 2. Explicitly stop the mainloop
-
-                root.after(delay_ms, close_slideshow)  # Call our new function
+                state["after"] = root.after(delay_ms, close_slideshow)  # Call our new function
+
+        def show(step):
+            # Manual navigation restarts the delay from the new slide.
+            index = state["index"] + step
+            if loop:
+                index %= len(image_files)
+            if not 0 <= index < len(image_files):
+                return
+            if state["after"] is not None:
+                root.after_cancel(state["after"])
+            update_image(index, step)
+
+        root.bind("<Right>", lambda event: show(1))
+        root.bind("<space>", lambda event: show(1))
+        root.bind("<Left>", lambda event: show(-1))
+        root.bind("<Escape>", lambda event: close_slideshow())
 
         try:
             update_image(0)
             root.mainloop()
         except tk.TclError:
             print("Slideshow window closed.")
+        finally:
+            prefetcher.stop()
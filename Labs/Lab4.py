@@ -1,8 +1,18 @@
-from PIL import Image, ImageOps
+from PIL import Image, ImageFilter, ImageOps
 import numpy as np
 import matplotlib.pyplot as plt
-from Common import Service
+from matplotlib.figure import Figure
+from Batch import BatchExecutor
+from Common import Service, load_image, save_image
+from Timing import timer
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import json
 import pathlib
+import Tiles
+
+# Rows of the arrays returned by Lab4Processor.image_histograms.
+HISTOGRAM_CHANNELS = ('R', 'G', 'B', 'L')
 
 
 class Lab4Processor:
@@ -32,31 +42,154 @@ class Lab4Processor:
             except Exception as e:
                 print(f"Failed to open {i}: {e}")
 
+    @timer.timed
+    def brightness_matrix_file(self, path):
+        """
+        Prints the brightness value matrix of one image file and returns it.
+        """
+        img = load_image(path)
+        # Convert to grayscale ('L' - luminance)
+        with timer.stage("convert"):
+            grayscale_img = img.convert('L')
+
+        # Convert image to NumPy matrix
+        brightness_matrix = np.array(grayscale_img)
+
+        print(f"\n--- Brightness Matrix for {pathlib.Path(path).name} ---")
+        # np.set_printoptions(threshold=np.inf) # Uncomments to disable output limit
+        print(brightness_matrix)
+        return brightness_matrix
+
+    def brightness_stats(self, histogram):
+        """
+        Returns min, max, mean, std and the 1/5/25/50/75/95/99th (nearest-rank) percentiles
+        of the brightness values counted in a 256-bin histogram.
+        """
+        histogram = np.asarray(histogram, dtype=np.int64)
+        total = int(histogram.sum())
+        if total == 0:
+            return {"pixels": 0}
+        values = np.arange(256, dtype=np.float64)
+        occupied = np.nonzero(histogram)[0]
+        mean = float(histogram @ values / total)
+        variance = float(histogram @ (values - mean) ** 2 / total)
+        cumulative = np.cumsum(histogram)
+
+        stats = {"pixels": total, "min": int(occupied[0]), "max": int(occupied[-1]),
+                 "mean": mean, "std": variance ** 0.5}
+        for q in (1, 5, 25, 50, 75, 95, 99):
+            # Smallest value with at least q% of the pixels at or below it.
+            stats[f"p{q}"] = int(np.searchsorted(cumulative, total * q / 100))
+        return stats
+
+    @timer.timed
+    def brightness_npy_file(self, path, output_dir, dtype='uint8', band_rows=512):
+        """
+        Writes the brightness matrix of one image file to {stem}_brightness.npy and its summary
+        statistics to {stem}_brightness_stats.json, and returns both paths.
+        The .npy is a memory-mapped file filled band by band, so neither the whole matrix nor a float
+        copy of it is ever held in memory. The statistics come from a histogram counted in the same pass.
+        Open the result with np.load(path, mmap_mode='r').
+        """
+        stem = pathlib.Path(path).stem
+        npy_path = pathlib.Path(output_dir) / f"{stem}_brightness.npy"
+        stats_path = pathlib.Path(output_dir) / f"{stem}_brightness_stats.json"
+
+        histogram = np.zeros(256, dtype=np.int64)
+        # Uncompressed TIFF/BMP/PPM files are read band by band as well, others are decoded once.
+        with Tiles.RegionReader(path) as reader:
+            width, height = reader.size
+            matrix = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.dtype(dtype), shape=(height, width))
+            for upper in range(0, height, band_rows):
+                lower = min(upper + band_rows, height)
+                with timer.stage("decode"):
+                    band = reader.read((0, upper, width, lower))
+                with timer.stage("convert"):
+                    band = band.convert('L')
+                histogram += band.histogram()
+                with timer.stage("write"):
+                    matrix[upper:lower] = np.asarray(band)
+            matrix.flush()
+            del matrix
+
+        stats = self.brightness_stats(histogram)
+        with open(stats_path, "w", encoding="utf-8") as f:
+            json.dump({"file": str(path), "width": width, "height": height, **stats}, f, indent=2)
+
+        print(f"\n--- Brightness of {pathlib.Path(path).name} ({width}x{height}) ---")
+        print(", ".join(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}"
+                        for key, value in stats.items()))
+        print(f"Matrix saved as {npy_path.name}")
+        return [npy_path, stats_path]
+
     def show_brightness_matrix(self):
         """
-        Task 2: Display the brightness value matrix on the screen.
+        Task 2: Display the brightness value matrix on the screen, or save it to .npy files.
         """
         files = self.service.get_images()
         if not files:
             print("Files not selected.")
             return
 
+        if input("Save the full matrices to .npy files instead of printing them? (Y/N): ").strip().upper() == 'Y':
+            output_dir = self.service.get_output_dir()
+            for i in files:
+                try:
+                    self.brightness_npy_file(i, output_dir)
+                except Exception as e:
+                    print(f"Failed to process {i}: {e}")
+            return
+
         for i in files:
             try:
-                img = Image.open(i)
-                # Convert to grayscale ('L' - luminance)
-                grayscale_img = img.convert('L')
-
-                # Convert image to NumPy matrix
-                brightness_matrix = np.array(grayscale_img)
-
-                print(f"\n--- Brightness Matrix for {pathlib.Path(i).name} ---")
-                # np.set_printoptions(threshold=np.inf) # Uncomments to disable output limit
-                print(brightness_matrix)
+                self.brightness_matrix_file(i)
 
             except Exception as e:
                 print(f"Failed to process {i}: {e}")
 
+    def finish_plot(self, path, output_dir, suffix):
+        """
+        Shows the current Matplotlib figure, or saves it as PNG when 'output_dir' is given.
+        Returns the saved path or None.
+        """
+        if not output_dir:
+            plt.show()  # Opens Matplotlib window with the graph
+            return None
+
+        filename = pathlib.Path(path).stem + suffix + ".png"
+        output_path = pathlib.Path(output_dir) / filename
+        plt.savefig(output_path)
+        plt.close()
+        print(f"Histogram saved as {filename}")
+        return output_path
+
+    @timer.timed
+    def color_histogram_file(self, path, output_dir=None):
+        """
+        Plots the R, G and B histograms of one image file.
+        """
+        img = load_image(path)
+        # Ensure image is RGB to split channels
+        with timer.stage("convert"):
+            rgb_img = img.convert('RGB')
+
+        # .histogram() returns a list of 256 values for each channel
+        # We split channels to get 3 separate histograms
+        r_hist = rgb_img.getchannel('R').histogram()
+        g_hist = rgb_img.getchannel('G').histogram()
+        b_hist = rgb_img.getchannel('B').histogram()
+
+        plt.figure(figsize=(10, 6))
+        plt.title(f'Color Histogram for {pathlib.Path(path).name}')
+        plt.plot(r_hist, color='red', alpha=0.7, label='Red')
+        plt.plot(g_hist, color='green', alpha=0.7, label='Green')
+        plt.plot(b_hist, color='blue', alpha=0.7, label='Blue')
+        plt.xlabel('Pixel Value')
+        plt.ylabel('Frequency')
+        plt.legend()
+        plt.grid(True)
+        return self.finish_plot(path, output_dir, "_color_histogram")
+
     def show_color_histogram(self):
         """
         Task 3: Construct a brightness histogram for a color image.
@@ -68,30 +201,32 @@ class Lab4Processor:
 
         for i in files:
             try:
-                img = Image.open(i)
-                # Ensure image is RGB to split channels
-                rgb_img = img.convert('RGB')
-
-                # .histogram() returns a list of 256 values for each channel
-                # We split channels to get 3 separate histograms
-                r_hist = rgb_img.getchannel('R').histogram()
-                g_hist = rgb_img.getchannel('G').histogram()
-                b_hist = rgb_img.getchannel('B').histogram()
-
-                plt.figure(figsize=(10, 6))
-                plt.title(f'Color Histogram for {pathlib.Path(i).name}')
-                plt.plot(r_hist, color='red', alpha=0.7, label='Red')
-                plt.plot(g_hist, color='green', alpha=0.7, label='Green')
-                plt.plot(b_hist, color='blue', alpha=0.7, label='Blue')
-                plt.xlabel('Pixel Value')
-                plt.ylabel('Frequency')
-                plt.legend()
-                plt.grid(True)
-                plt.show()  # Opens Matplotlib window with the graph
+                self.color_histogram_file(i)
 
             except Exception as e:
                 print(f"Failed to plot histogram for {i}: {e}")
 
+    @timer.timed
+    def grayscale_histogram_file(self, path, output_dir=None):
+        """
+        Plots the grayscale histogram of one image file.
+        """
+        img = load_image(path)
+        with timer.stage("convert"):
+            grayscale_img = img.convert('L')
+
+        # .histogram() for 'L' mode returns a single histogram
+        grayscale_hist = grayscale_img.histogram()
+
+        plt.figure(figsize=(10, 6))
+        plt.title(f'Grayscale Histogram for {pathlib.Path(path).name}')
+        plt.plot(grayscale_hist, color='black')
+        plt.xlabel('Brightness Value (0-255)')
+        plt.ylabel('Frequency')
+        plt.fill_between(range(256), grayscale_hist, color='gray', alpha=0.5)
+        plt.grid(True)
+        return self.finish_plot(path, output_dir, "_grayscale_histogram")
+
     def show_grayscale_histogram(self):
         """
         Task 4 (partial): Construct a grayscale histogram.
@@ -103,24 +238,113 @@ class Lab4Processor:
 
         for i in files:
             try:
-                img = Image.open(i)
-                grayscale_img = img.convert('L')
-
-                # .histogram() for 'L' mode returns a single histogram
-                grayscale_hist = grayscale_img.histogram()
-
-                plt.figure(figsize=(10, 6))
-                plt.title(f'Grayscale Histogram for {pathlib.Path(i).name}')
-                plt.plot(grayscale_hist, color='black')
-                plt.xlabel('Brightness Value (0-255)')
-                plt.ylabel('Frequency')
-                plt.fill_between(range(256), grayscale_hist, color='gray', alpha=0.5)
-                plt.grid(True)
-                plt.show()
+                self.grayscale_histogram_file(i)
 
             except Exception as e:
                 print(f"Failed to plot histogram for {i}: {e}")
 
+    @staticmethod
+    def image_histograms(path, plot_dir=None):
+        """
+        Returns a (4, 256) array with the R, G, B and luminance histograms of one image file.
+        With 'plot_dir' the histograms are also drawn to a PNG there, without any GUI window.
+        """
+        with Image.open(path) as img:
+            with timer.stage("convert"):
+                rgb_img = img.convert('RGB')
+                gray_img = rgb_img.convert('L')
+        # histogram() counts every band in one pass in C: 768 values for RGB, 256 for L.
+        histograms = np.empty((len(HISTOGRAM_CHANNELS), 256), dtype=np.int64)
+        histograms[:3] = np.reshape(rgb_img.histogram(), (3, 256))
+        histograms[3] = gray_img.histogram()
+
+        if plot_dir is not None:
+            # A bare Figure renders with Agg and never touches the pyplot GUI state.
+            fig = Figure(figsize=(10, 6))
+            ax = fig.add_subplot()
+            ax.set_title(f'Histogram for {pathlib.Path(path).name}')
+            for channel, color in zip(histograms, ('red', 'green', 'blue', 'black')):
+                ax.plot(channel, color=color, alpha=0.7)
+            ax.fill_between(range(256), histograms[3], color='gray', alpha=0.3)
+            ax.legend(['Red', 'Green', 'Blue', 'Luminance'])
+            ax.set_xlabel('Pixel Value')
+            ax.set_ylabel('Frequency')
+            ax.grid(True)
+            fig.savefig(pathlib.Path(plot_dir) / (pathlib.Path(path).stem + "_histogram.png"))
+        return histograms
+
+    @timer.timed
+    def histogram_batch(self, paths, output_dir, workers=None, plots=False, name="histograms"):
+        """
+        Computes the histograms of many image files on a process pool and writes them as one dataset:
+        {name}.npz (arrays 'files', 'channels' and 'histograms' of shape (files, 4, 256)) and {name}.csv
+        (one row per file and channel). With 'plots' a histogram PNG per file is rendered as well.
+        Returns the list of written dataset paths.
+        """
+        output_dir = pathlib.Path(output_dir)
+        plot_dir = output_dir if plots else None
+
+        files = []
+        histograms = []
+        executor = BatchExecutor(workers)
+        for result in executor.map(Lab4Processor.image_histograms, ((path, plot_dir) for path in paths)):
+            if result.ok:
+                files.append(str(result.path))
+                histograms.append(result.value)
+        executor.print_errors()
+
+        data = np.stack(histograms) if histograms else np.zeros((0, len(HISTOGRAM_CHANNELS), 256), np.int64)
+        npz_path = output_dir / f"{name}.npz"
+        np.savez_compressed(npz_path, files=np.array(files), channels=np.array(HISTOGRAM_CHANNELS),
+                            histograms=data)
+
+        csv_path = output_dir / f"{name}.csv"
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file", "channel", *range(256)])
+            for file, file_histograms in zip(files, data):
+                for channel, counts in zip(HISTOGRAM_CHANNELS, file_histograms):
+                    writer.writerow([file, channel, *counts.tolist()])
+
+        print(f"Histograms of {len(files)} image(s) saved as {npz_path.name} and {csv_path.name}")
+        return [npz_path, csv_path]
+
+    def export_histograms(self):
+        """
+        Computes the histograms of all selected images at once and saves them to files.
+        """
+        files = self.service.get_images()
+        if not files:
+            print("Files not selected.")
+            return
+        output_dir = self.service.get_output_dir()
+        plots = input("Also save a histogram plot for every image? (Y/N): ").strip().upper() == 'Y'
+
+        try:
+            self.histogram_batch(files, output_dir, plots=plots)
+        except Exception as e:
+            print(f"Failed to export histograms: {e}")
+
+    def to_grayscale(self, img):
+        """
+        Converts an image to shades of gray ('L').
+        """
+        with timer.stage("convert"):
+            return img.convert('L')
+
+    @timer.timed
+    def grayscale_file(self, path, output_dir):
+        """
+        Converts one image file to shades of gray and returns the output path.
+        """
+        grayscale_img = self.to_grayscale(load_image(path))
+
+        filename = pathlib.Path(path).stem + "_grayscale" + ".png"
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(grayscale_img, output_path)
+        print(f"Saved in grayscale: {filename}")
+        return output_path
+
     def convert_to_grayscale(self):
         """
         Task 4: Convert to shades of gray.
@@ -132,17 +356,34 @@ class Lab4Processor:
 
         for i in files:
             try:
-                img = Image.open(i)
-                grayscale_img = img.convert('L')
-
-                filename = pathlib.Path(i).stem + "_grayscale" + ".png"
-                output_path = pathlib.Path(output_dir) / filename
-                grayscale_img.save(output_path)
-                print(f"Saved in grayscale: {filename}")
+                self.grayscale_file(i, output_dir)
 
             except Exception as e:
                 print(f"Failed to convert {i}: {e}")
 
+    def to_negative(self, img):
+        """
+        Returns the negative of an image as RGB.
+        """
+        # Invert works correctly with RGB
+        with timer.stage("convert"):
+            rgb_img = img.convert('RGB')
+
+        return ImageOps.invert(rgb_img)
+
+    @timer.timed
+    def invert_file(self, path, output_dir):
+        """
+        Saves the negative of one image file and returns the output path.
+        """
+        inverted_img = self.to_negative(load_image(path))
+
+        filename = pathlib.Path(path).stem + "_inverted" + ".png"
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(inverted_img, output_path)
+        print(f"Saved negative: {filename}")
+        return output_path
+
     def invert_image(self):
         """
         Task 4: Negative.
@@ -154,20 +395,113 @@ class Lab4Processor:
 
         for i in files:
             try:
-                img = Image.open(i)
-                # Invert works correctly with RGB
-                rgb_img = img.convert('RGB')
-
-                inverted_img = ImageOps.invert(rgb_img)
-
-                filename = pathlib.Path(i).stem + "_inverted" + ".png"
-                output_path = pathlib.Path(output_dir) / filename
-                inverted_img.save(output_path)
-                print(f"Saved negative: {filename}")
+                self.invert_file(i, output_dir)
 
             except Exception as e:
                 print(f"Failed to invert {i}: {e}")
 
+    def to_binary(self, img, threshold=128):
+        """
+        Converts an image to black and white ('1') with a fixed threshold.
+        """
+        with timer.stage("convert"):
+            grayscale_img = img.convert('L')
+
+        # Use .point() to apply threshold
+        # '1' - 1-bit image mode (black or white)
+        return grayscale_img.point(lambda p: 255 if p > threshold else 0, '1')
+
+    def otsu_threshold(self, histogram):
+        """
+        Returns Otsu's threshold for a 256-bin histogram: the value t that maximizes the variance
+        between the classes [0, t] and [t + 1, 255], matching 'p > threshold' in to_binary.
+        """
+        histogram = np.asarray(histogram, dtype=np.float64)
+        levels = np.arange(256, dtype=np.float64)
+        # Pixel count and intensity sum of the dark class for every candidate t.
+        weight = np.cumsum(histogram)
+        intensity = np.cumsum(histogram * levels)
+        total, total_intensity = weight[-1], intensity[-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_dark = intensity / weight
+            mean_light = (total_intensity - intensity) / (total - weight)
+            between = weight * (total - weight) * (mean_dark - mean_light) ** 2
+        return int(np.argmax(np.nan_to_num(between)))
+
+    def adaptive_binary(self, img, method='mean', block_size=31, offset=5, band_rows=1024):
+        """
+        Local thresholding: a pixel becomes white if it is brighter than the mean ('mean') or the
+        Gaussian-weighted mean ('gaussian') of its block_size x block_size neighbourhood minus 'offset'.
+        Returns a '1' image.
+        """
+        if block_size < 3 or block_size % 2 == 0:
+            raise ValueError("block_size must be an odd number of at least 3")
+        with timer.stage("convert"):
+            grayscale_img = img.convert('L')
+        values = np.asarray(grayscale_img)
+
+        if method == 'gaussian':
+            # Pillow's Gaussian blur runs as successive box blurs over running sums in C.
+            # The sigma is the one OpenCV derives from the block size.
+            sigma = 0.3 * ((block_size - 1) * 0.5 - 1) + 0.8
+            local = np.asarray(grayscale_img.filter(ImageFilter.GaussianBlur(sigma)))
+            return Image.fromarray(values.astype(np.int16) > local.astype(np.int16) - offset)
+        if method != 'mean':
+            raise ValueError(f"Unknown adaptive method '{method}', use 'mean' or 'gaussian'")
+
+        radius = block_size // 2
+        area = block_size * block_size
+        height, width = values.shape
+        result = np.empty((height, width), dtype=bool)
+        # Integral images per band of rows keep memory near the band size even for huge scans.
+        for upper in range(0, height, band_rows):
+            lower = min(upper + band_rows, height)
+            top, bottom = max(upper - radius, 0), min(lower + radius, height)
+            # Replicate the edge pixels, so every pixel has a full window.
+            padded = np.pad(values[top:bottom], ((radius - (upper - top), radius - (bottom - lower)),
+                                                 (radius, radius)), mode='edge')
+            integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.uint32)
+            # uint32 sums wrap around on huge bands, but window sums (at most 255 * area) still come out exact.
+            np.cumsum(padded, axis=0, dtype=np.uint32, out=integral[1:, 1:])
+            np.cumsum(integral[1:, 1:], axis=1, dtype=np.uint32, out=integral[1:, 1:])
+            window = (integral[block_size:, block_size:] - integral[:-block_size, block_size:]
+                      - integral[block_size:, :-block_size] + integral[:-block_size, :-block_size])
+            # value > sum / area - offset, in integers.
+            result[upper:lower] = (values[upper:lower].astype(np.int64) * area
+                                   > window.astype(np.int64) - offset * area)
+        return Image.fromarray(result)
+
+    def binarize(self, img, threshold=128, method='fixed', block_size=31, offset=5):
+        """
+        Binarizes an image and returns ('1' image, description of the threshold used).
+        'method' is 'fixed' ('threshold'), 'otsu' (threshold from the histogram), or 'mean' / 'gaussian'
+        (local thresholds over 'block_size' neighbourhoods, see adaptive_binary).
+        """
+        if method in ('mean', 'gaussian'):
+            return (self.adaptive_binary(img, method, block_size, offset),
+                    f"adaptive {method} threshold, block {block_size}, offset {offset}")
+        if method not in ('fixed', 'otsu'):
+            raise ValueError(f"Unknown binarization method '{method}'")
+        if method == 'otsu':
+            with timer.stage("convert"):
+                img = img.convert('L')
+            threshold = self.otsu_threshold(img.histogram())
+        return self.to_binary(img, threshold), f"{method} threshold {threshold}"
+
+    @timer.timed
+    def binarize_file(self, path, output_dir, threshold=128, method='fixed', block_size=31, offset=5):
+        """
+        Binarizes one image file (see binarize) and returns the output path. The threshold used is printed.
+        """
+        binarized_img, description = self.binarize(load_image(path), threshold, method, block_size, offset)
+        print(f"{pathlib.Path(path).name}: {description}")
+
+        filename = pathlib.Path(path).stem + "_binarized" + ".png"
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(binarized_img, output_path)
+        print(f"Saved binarized image: {filename}")
+        return output_path
+
     def binarize_image(self):
         """
         Task 4: Binarization (Black and White).
@@ -177,28 +511,83 @@ class Lab4Processor:
         if not files or not output_dir:
             return
 
-        try:
-            # Ask user for threshold
-            threshold = int(input("Enter binarization threshold (0-255, default 128): ") or 128)
-            if not 0 <= threshold <= 255:
-                raise ValueError
-        except ValueError:
-            print("Invalid value. Using threshold 128.")
-            threshold = 128
-
+        params = self.input_binarize_params()
         for i in files:
             try:
-                img = Image.open(i)
-                grayscale_img = img.convert('L')
+                self.binarize_file(i, output_dir, **params)
 
-                # Use .point() to apply threshold
-                # '1' - 1-bit image mode (black or white)
-                binarized_img = grayscale_img.point(lambda p: 255 if p > threshold else 0, '1')
+            except Exception as e:
+                print(f"Failed to binarize {i}: {e}")
 
-                filename = pathlib.Path(i).stem + "_binarized" + ".png"
-                output_path = pathlib.Path(output_dir) / filename
-                binarized_img.save(output_path)
-                print(f"Saved binarized image: {filename}")
+    def input_binarize_params(self):
+        """
+        Asks for the binarization method and its settings and returns them as binarize() parameters.
+        """
+        print("1. Fixed threshold")
+        print("2. Automatic threshold (Otsu)")
+        print("3. Adaptive local threshold (mean)")
+        print("4. Adaptive local threshold (Gaussian)")
+        choice = input("Choose binarization method (default 1): ").strip() or '1'
+        params = {"method": {'1': 'fixed', '2': 'otsu', '3': 'mean', '4': 'gaussian'}.get(choice, 'fixed')}
+
+        if params["method"] == 'fixed':
+            try:
+                # Ask user for threshold
+                threshold = int(input("Enter binarization threshold (0-255, default 128): ") or 128)
+                if not 0 <= threshold <= 255:
+                    raise ValueError
+            except ValueError:
+                print("Invalid value. Using threshold 128.")
+                threshold = 128
+            params["threshold"] = threshold
+        elif params["method"] in ('mean', 'gaussian'):
+            try:
+                params["block_size"] = int(input("Enter block size (odd, e.g. 31): ") or 31)
+                params["offset"] = int(input("Enter offset subtracted from the local mean (e.g. 5): ") or 5)
+            except ValueError:
+                print("Invalid value. Using block 31 and offset 5.")
+                params["block_size"], params["offset"] = 31, 5
+        return params
+
+    @timer.timed
+    def derivatives_file(self, path, output_dir, threshold=128, method='fixed', block_size=31, offset=5):
+        """
+        Saves the grayscale, negative and binary versions of one image file and returns the three output paths.
+        The file is decoded once, the binary image is derived from the grayscale one,
+        and the three PNGs are encoded concurrently. Binarization parameters are as in binarize().
+        """
+        img = load_image(path)
+        img.load()
+        grayscale_img = self.to_grayscale(img)
+        inverted_img = self.to_negative(img)
+        binarized_img, description = self.binarize(grayscale_img, threshold, method, block_size, offset)
+
+        stem = pathlib.Path(path).stem
+        outputs = [(grayscale_img, pathlib.Path(output_dir) / f"{stem}_grayscale.png"),
+                   (inverted_img, pathlib.Path(output_dir) / f"{stem}_inverted.png"),
+                   (binarized_img, pathlib.Path(output_dir) / f"{stem}_binarized.png")]
+
+        # Pillow encoders release the GIL, so the three encodes overlap on threads.
+        # Plain save: the shared timer is not thread-safe, all three are timed together as 'encode'.
+        with timer.stage("encode"), ThreadPoolExecutor(max_workers=len(outputs)) as pool:
+            list(pool.map(lambda output: output[0].save(output[1]), outputs))
+
+        print(f"Saved grayscale, negative and binary ({description}) versions of {pathlib.Path(path).name}")
+        return [output_path for _, output_path in outputs]
+
+    def convert_all(self):
+        """
+        Grayscale, negative and binary versions of every image in one pass.
+        """
+        files = self.service.get_images()
+        output_dir = self.service.get_output_dir()
+        if not files or not output_dir:
+            return
+
+        params = self.input_binarize_params()
+        for i in files:
+            try:
+                self.derivatives_file(i, output_dir, **params)
 
             except Exception as e:
-                print(f"Failed to binarize {i}: {e}")
\ No newline at end of file
+                print(f"Failed to convert {i}: {e}")
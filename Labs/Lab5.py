@@ -1,8 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
 from PIL import Image
 import numpy as np
-from Common import Service
+from Common import Service, load_image, save_image
+from Timing import timer
 import pathlib
 
+# Edge operators: name -> description.
+EDGE_OPERATORS = {
+    "roberts": "Roberts cross (2x2 diagonal differences)",
+    "sobel": "Sobel (3x3, smoothing 1-2-1)",
+    "prewitt": "Prewitt (3x3, smoothing 1-1-1)",
+    "scharr": "Scharr (3x3, smoothing 3-10-3)",
+    "laplacian": "Laplacian (3x3, 4-neighbour second derivative)",
+}
+
+# Separable 3x3 operators: name -> (side, centre) weights of the smoothing kernel.
+# The derivative kernel is always (-1, 0, 1).
+SEPARABLE_OPERATORS = {
+    "sobel": (1, 2),
+    "prewitt": (1, 1),
+    "scharr": (3, 10),
+}
+
+# Rows per band of the edge engine: the band buffers stay small next to the full-size arrays.
+EDGE_BAND_ROWS = 128
+
 
 class Lab5Processor:
     """
@@ -12,61 +36,279 @@ class Lab5Processor:
     def __init__(self):
         self.service = Service()
 
-    def roberts_edge_detection(self):
+    def roberts_gradient(self, img_array):
         """
-        Task: Edge detection using Roberts Cross Operator.
-        This algorithm highlights regions of high spatial gradient (edges).
+        Calculates the Roberts gradient magnitude of an int32 brightness array.
+        The result is one row and one column smaller than the input.
         """
-        files = self.service.get_images()
-        output_dir = self.service.get_output_dir()
+        # Roberts Cross Calculation
+        # Gx = P(x,y) - P(x+1, y+1)
+        gx = img_array[:-1, :-1] - img_array[1:, 1:]
 
-        if not files or not output_dir:
-            print("Files or output directory not selected.")
-            return
+        # Gy = P(x, y+1) - P(x+1, y)
+        gy = img_array[:-1, 1:] - img_array[1:, :-1]
 
-        for i in files:
-            try:
-                img = Image.open(i)
-                # Convert to grayscale ('L')
-                gray_img = img.convert('L')
+        # Calculate Gradient Magnitude
+        return np.sqrt(gx ** 2 + gy ** 2)
+
+    def gradient_to_array(self, gradient, max_val, shape):
+        """
+        Stretches a gradient to 0-255 by 'max_val' and places it into a uint8 array of 'shape'.
+        """
+        # Roberts operator often produces weak values.
+        # Normalizing (stretching) the result to 0-255 makes edges more visible.
+        if max_val > 0:
+            gradient = (gradient / max_val) * 255
+
+        # Convert gradient to uint8
+        gradient = gradient.astype('uint8')
+
+        # We explicitly use dtype=np.uint8.
+        # If we used zeros_like(img_array), it would be int32, causing the "Black Image" bug.
+        roberts_img = np.zeros(shape, dtype=np.uint8)
 
-                # Use int32 for calculations to avoid overflow/underflow during subtraction
-                img_array = np.asarray(gray_img, dtype="int32")
+        # Place the result (which is 1 pixel smaller) into the image
+        roberts_img[:gradient.shape[0], :gradient.shape[1]] = gradient
+        return roberts_img
 
-                # Roberts Cross Calculation
-                # Gx = P(x,y) - P(x+1, y+1)
-                gx = img_array[:-1, :-1] - img_array[1:, 1:]
+    def roberts_edge_image(self, img, workers=None):
+        """
+        Applies the Roberts Cross Operator to an image and returns the 'L' edge map.
+        """
+        return self.edge_image(img, 'roberts', workers)
 
-                # Gy = P(x, y+1) - P(x+1, y)
-                gy = img_array[:-1, 1:] - img_array[1:, :-1]
+    @staticmethod
+    def pad_band(values, upper, lower, padded):
+        """
+        Copies rows upper:lower of a uint8 array into 'padded' with a one-pixel border of replicated edge pixels.
+        """
+        height = values.shape[0]
+        rows = lower - upper
+        padded[1:rows + 1, 1:-1] = values[upper:lower]
+        padded[0, 1:-1] = values[max(upper - 1, 0)]
+        padded[rows + 1, 1:-1] = values[min(lower, height - 1)]
+        padded[:rows + 2, 0] = padded[:rows + 2, 1]
+        padded[:rows + 2, -1] = padded[:rows + 2, -2]
+
+    @staticmethod
+    def band_energy(operator, padded, rows, out, first, second):
+        """
+        Writes the squared gradient magnitude of one padded band into 'out' (rows x width, float32).
+        'first' and 'second' are (rows + 2) x width float32 scratch buffers; no other arrays are allocated.
+        """
+        p = padded[:rows + 2]
+        if operator == 'roberts':
+            # Gx = P(x,y) - P(x+1, y+1), Gy = P(x, y+1) - P(x+1, y)
+            np.subtract(p[1:-1, 1:-1], p[2:, 2:], out=out)
+            out *= out
+            gy = first[:rows]
+            np.subtract(p[1:-1, 2:], p[2:, 1:-1], out=gy)
+            gy *= gy
+            out += gy
+        elif operator == 'laplacian':
+            # Sum of the 4 neighbours minus 4 times the centre.
+            np.add(p[1:-1, :-2], p[1:-1, 2:], out=out)
+            out += p[:-2, 1:-1]
+            out += p[2:, 1:-1]
+            centre = first[:rows]
+            np.multiply(p[1:-1, 1:-1], 4, out=centre)
+            out -= centre
+            out *= out
+        else:
+            side, centre = SEPARABLE_OPERATORS[operator]
+            # Gx: horizontal derivative, then vertical smoothing.
+            d = first[:rows + 2]
+            np.subtract(p[:, 2:], p[:, :-2], out=d)
+            np.add(d[:-2], d[2:], out=out)
+            if side != 1:
+                out *= side
+            np.multiply(d[1:-1], centre, out=second[:rows])
+            out += second[:rows]
+            out *= out
+            # Gy: horizontal smoothing, then vertical derivative.
+            s = first[:rows + 2]
+            np.add(p[:, :-2], p[:, 2:], out=s)
+            if side != 1:
+                s *= side
+            np.multiply(p[:, 1:-1], centre, out=second[:rows + 2])
+            s += second[:rows + 2]
+            gy = second[:rows]
+            np.subtract(s[2:], s[:-2], out=gy)
+            gy *= gy
+            out += gy
+
+    @staticmethod
+    def slabs(height, workers):
+        """
+        Splits 'height' rows into at most 'workers' contiguous (upper, lower) ranges of near-equal size.
+        """
+        count = max(1, min(workers, height))
+        return [(height * i // count, height * (i + 1) // count) for i in range(count)]
+
+    @staticmethod
+    def run_slabs(func, slabs):
+        """
+        Calls func(upper, lower) for every slab, on a thread pool when there is more than one,
+        and returns the results in slab order.
+        """
+        if len(slabs) == 1:
+            return [func(*slabs[0])]
+        # NumPy releases the GIL in the band arithmetic, so the slabs run on all cores.
+        with ThreadPoolExecutor(max_workers=len(slabs)) as pool:
+            return list(pool.map(lambda slab: func(*slab), slabs))
+
+    def gradient_energy(self, values, operator='sobel', band_rows=EDGE_BAND_ROWS, workers=None):
+        """
+        Returns (energy, peak): the squared gradient magnitude of a uint8 brightness array as a float32 array
+        of the same shape, and its largest value.
+        The rows are split into one slab per worker thread, and each slab is processed in bands of 'band_rows'
+        that read one halo row above and below, so besides the result only the band buffers are allocated.
+        Borders use replicated edge pixels; Roberts leaves the last row and column at zero.
+        """
+        if operator not in EDGE_OPERATORS:
+            raise ValueError(f"Unknown edge operator '{operator}'. Available: {', '.join(EDGE_OPERATORS)}")
+        height, width = values.shape
+        energy = np.empty((height, width), dtype=np.float32)
+
+        def energy_slab(slab_upper, slab_lower):
+            rows = min(band_rows, slab_lower - slab_upper)
+            padded = np.empty((rows + 2, width + 2), dtype=np.float32)
+            first = np.empty((rows + 2, width), dtype=np.float32)
+            second = np.empty((rows + 2, width), dtype=np.float32)
+
+            for upper in range(slab_upper, slab_lower, rows):
+                lower = min(upper + rows, slab_lower)
+                self.pad_band(values, upper, lower, padded)
+                self.band_energy(operator, padded, lower - upper, energy[upper:lower], first, second)
+
+            slab = energy[slab_upper:slab_lower]
+            if operator == 'roberts':
+                # The Roberts cross has no neighbour past the last row and column.
+                slab[:, -1] = 0
+                if slab_lower == height:
+                    slab[-1] = 0
+            # Each slab reports its own maximum; the largest one is the global maximum.
+            return slab.max()
+
+        peak = max(self.run_slabs(energy_slab, self.slabs(height, workers or os.cpu_count() or 1)))
+        return energy, peak
+
+    def energy_to_array(self, energy, peak, band_rows=EDGE_BAND_ROWS, workers=None):
+        """
+        Stretches the magnitude (square root of 'energy') to 0-255 by the largest one and returns it as uint8.
+        'peak' is the largest energy. The square root is taken per band in float64, so integer energies give
+        exactly the Roberts results of gradient_to_array. Slabs run on 'workers' threads as in gradient_energy.
+        """
+        height, width = energy.shape
+        result = np.empty((height, width), dtype=np.uint8)
+        # sqrt is monotonic, so the largest magnitude is the root of the largest energy.
+        max_val = np.sqrt(np.float64(peak))
 
-                # Calculate Gradient Magnitude
-                gradient = np.sqrt(gx ** 2 + gy ** 2)
+        def stretch_slab(slab_upper, slab_lower):
+            rows = min(band_rows, slab_lower - slab_upper)
+            band = np.empty((rows, width), dtype=np.float64)
 
-                # Roberts operator often produces weak values.
-                # Normalizing (stretching) the result to 0-255 makes edges more visible.
-                max_val = gradient.max()
+            for upper in range(slab_upper, slab_lower, rows):
+                lower = min(upper + rows, slab_lower)
+                magnitude = band[:lower - upper]
+                magnitude[...] = energy[upper:lower]
+                np.sqrt(magnitude, out=magnitude)
                 if max_val > 0:
-                    gradient = (gradient / max_val) * 255
+                    magnitude /= max_val
+                    magnitude *= 255
+                # Truncates like astype('uint8').
+                np.copyto(result[upper:lower], magnitude, casting='unsafe')
+
+        self.run_slabs(stretch_slab, self.slabs(height, workers or os.cpu_count() or 1))
+        return result
 
-                # Convert gradient to uint8
-                gradient = gradient.astype('uint8')
+    def edge_image(self, img, operator='sobel', workers=None):
+        """
+        Applies an edge operator from EDGE_OPERATORS to an image and returns the 'L' edge map,
+        stretched to 0-255. Peak memory is one float32 and one uint8 array of the image size.
+        The work is split over 'workers' threads (default: one per CPU); the result doesn't depend on it.
+        """
+        with timer.stage("convert"):
+            gray_img = img.convert('L')
 
-                # We explicitly use dtype=np.uint8.
-                # If we used zeros_like(img_array), it would be int32, causing the "Black Image" bug.
-                h, w = img_array.shape
-                roberts_img = np.zeros((h, w), dtype=np.uint8)
+        energy, peak = self.gradient_energy(np.asarray(gray_img), operator, workers=workers)
+        return Image.fromarray(self.energy_to_array(energy, peak, workers=workers))
 
-                # Place the result (which is 1 pixel smaller) into the image
-                roberts_img[:-1, :-1] = gradient
+    @timer.timed
+    def roberts_file(self, path, output_dir, workers=None):
+        """
+        Runs Roberts edge detection on one image file with 'workers' threads and returns the output path.
+        """
+        final_img = self.roberts_edge_image(load_image(path), workers)
 
-                # Create image from uint8 array -> Creates Mode 'L' (Standard Grayscale)
-                final_img = Image.fromarray(roberts_img)
+        filename = pathlib.Path(path).stem + "_roberts" + ".png"
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(final_img, output_path)
+        print(f"Edge detection completed. Saved as: {filename}")
+        return output_path
 
-                filename = pathlib.Path(i).stem + "_roberts" + ".png"
-                output_path = pathlib.Path(output_dir) / filename
-                final_img.save(output_path)
-                print(f"Edge detection completed. Saved as: {filename}")
+    @timer.timed
+    def edge_file(self, path, output_dir, operator='sobel', workers=None):
+        """
+        Runs edge detection with 'operator' (see EDGE_OPERATORS) on one image file with 'workers' threads
+        and returns the output path.
+        """
+        final_img = self.edge_image(load_image(path), operator, workers)
+
+        filename = pathlib.Path(path).stem + "_" + operator + ".png"
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(final_img, output_path)
+        print(f"Edge detection ({operator}) completed. Saved as: {filename}")
+        return output_path
+
+    def input_operator(self):
+        """
+        Asks for an edge operator and returns its name.
+        """
+        names = list(EDGE_OPERATORS)
+        for number, name in enumerate(names, 1):
+            print(f"{number}. {EDGE_OPERATORS[name]}")
+        choice = input("Choose edge operator (default 2): ").strip() or '2'
+        try:
+            return names[int(choice) - 1]
+        except (ValueError, IndexError):
+            print("Invalid choice. Using Sobel.")
+            return 'sobel'
+
+    def edge_detection(self):
+        """
+        Edge detection with a choice of operator: Roberts, Sobel, Prewitt, Scharr or Laplacian.
+        """
+        files = self.service.get_images()
+        output_dir = self.service.get_output_dir()
+
+        if not files or not output_dir:
+            print("Files or output directory not selected.")
+            return
+
+        operator = self.input_operator()
+        for i in files:
+            try:
+                self.edge_file(i, output_dir, operator)
+
+            except Exception as e:
+                print(f"Failed to process {i}: {e}")
+
+    def roberts_edge_detection(self):
+        """
+        Task: Edge detection using Roberts Cross Operator.
+        This algorithm highlights regions of high spatial gradient (edges).
+        """
+        files = self.service.get_images()
+        output_dir = self.service.get_output_dir()
+
+        if not files or not output_dir:
+            print("Files or output directory not selected.")
+            return
+
+        for i in files:
+            try:
+                self.roberts_file(i, output_dir)
 
             except Exception as e:
-                print(f"Failed to process {i}: {e}")
\ No newline at end of file
+                print(f"Failed to process {i}: {e}")
@@ -1,7 +1,37 @@
 from PIL import Image, ImageFilter
 import numpy as np
+import csv
+import json
 import pathlib
-from Common import Service
+from Batch import BatchExecutor
+from Common import ALL_IMAGE_FORMATS_MAP, Service, load_image
+from Timing import timer
+import Metrics
+
+# Noise of the standard test images made by Lab6ImageGenerator.py: file stem -> noise type.
+# Other images take the type from their name: 'impulse_12.bmp' -> 'impulse'.
+NOISE_TYPES = {
+    "0": "none",
+    "1": "additive", "2": "additive",
+    "3": "impulse", "4": "impulse",
+    "5": "brightness-dependent", "6": "brightness-dependent",
+    "7": "coordinate-dependent", "8": "coordinate-dependent",
+}
+
+# Columns of the analysis table, followed by one column per reported metric.
+ANALYSIS_COLUMNS = ("image", "noise_type", "filter", "filter_type")
+
+# Reference array, filter set and metrics of the current analysis, set once per worker process by _init_analysis.
+_analysis = None
+
+
+def _init_analysis(reference, filters, metrics):
+    """
+    BatchExecutor initializer: shares the decoded reference, the filters and the metrics
+    with every task of the worker.
+    """
+    global _analysis
+    _analysis = (reference, filters, metrics)
 
 
 class Lab6Processor:
@@ -14,29 +44,21 @@ class Lab6Processor:
         self.service = Service()
         self.test_dir = "Tests_for_lab_6"  # Папка з файлами 0.bmp ... 8.bmp
 
-    def calculate_mse(self, original_img, filtered_img):
+    @staticmethod
+    def calculate_mse(original_img, filtered_img):
         """
         Calculates Mean Squared Error (MSE) using NumPy for analysis.
         Note: This is an analysis metric, not a filter implementation.
         """
-        arr_orig = np.asarray(original_img, dtype="float")
-        arr_filt = np.asarray(filtered_img, dtype="float")
+        return Metrics.mse(original_img, filtered_img)
 
-        diff = arr_orig - arr_filt
-        sq_diff = diff ** 2
-        mse = np.mean(sq_diff)
-        return mse
-
-    def run_analysis(self):
+    def get_filters(self):
         """
-        Main execution method for Lab 6.
+        Returns the (name, filter, type) list of filters used in the analysis.
+        Uses ONLY PIL.ImageFilter.
         """
-        print(f"Looking for test images in folder: ./{self.test_dir}/")
-
-        # --- 1. Define Filter Set using ONLY PIL.ImageFilter ---
         # Використовуємо вбудовані класи фільтрів.
         # Для отримання 7 нелінійних фільтрів варіюємо типи та розміри ядра.
-
         filters = [
             # === Linear Filters (3 required) ===
             ("Box Blur (3x3)", ImageFilter.BoxBlur(1), "Linear"),  # Radius 1 -> 3x3 kernel
@@ -65,46 +87,172 @@ class Lab6Processor:
             # 7. Mode Filter 3x3 (Frequent pixel value, good for speckled noise)
             ("Mode Filter (3x3)", ImageFilter.ModeFilter(size=3), "Non-Linear"),
         ]
+        return filters
+
+    @staticmethod
+    def noise_type(path):
+        """
+        Returns the noise type of a test image from NOISE_TYPES or from its name ('impulse_12' -> 'impulse').
+        """
+        stem = pathlib.Path(path).stem
+        if stem in NOISE_TYPES:
+            return NOISE_TYPES[stem]
+        return stem.rsplit("_", 1)[0] if "_" in stem else "unknown"
+
+    @staticmethod
+    def test_images(test_dir):
+        """
+        Returns the image files of 'test_dir', numbered ones (0.bmp, 1.bmp, ...) first and in numeric order.
+        """
+        extensions = set(ALL_IMAGE_FORMATS_MAP.values())
+        files = [path for path in pathlib.Path(test_dir).iterdir()
+                 if path.is_file() and path.suffix.lower() in extensions]
+        return sorted(files, key=lambda path: (not path.stem.isdigit(),
+                                               int(path.stem) if path.stem.isdigit() else 0, path.name))
+
+    @staticmethod
+    def analyse_image(path):
+        """
+        Applies every filter of the current analysis to one image and returns a table row per filter
+        with the requested metrics. Runs in BatchExecutor workers after _init_analysis.
+        """
+        reference, filters, metrics = _analysis
+        rows = []
+        with timer.track("run_analysis", path):
+            # Відкриваємо та конвертуємо в градації сірого (L)
+            current_img = load_image(path)
+            with timer.stage("convert"):
+                current_img = current_img.convert('L')
+
+            for f_name, f_obj, f_type in filters:
+                # Застосування вбудованого фільтра PIL
+                filtered_img = current_img.filter(f_obj)
+
+                # Розрахунок помилки відносно еталону (0.bmp)
+                rows.append({"image": pathlib.Path(path).name, "noise_type": Lab6Processor.noise_type(path),
+                             "filter": f_name, "filter_type": f_type,
+                             **Metrics.compare(reference, filtered_img, metrics)})
+        return rows
+
+    @staticmethod
+    def sort_analysis(rows, metric="mse"):
+        """
+        Orders table rows by noise type (in order of first appearance) and, within each type,
+        from the best to the worst 'metric' value.
+        """
+        order = {}
+        for row in rows:
+            order.setdefault(row["noise_type"], len(order))
+        sign = -1 if metric in Metrics.HIGHER_IS_BETTER else 1
+        return sorted(rows, key=lambda row: (order[row["noise_type"]], sign * row[metric], row["image"]))
+
+    def write_analysis(self, rows, output_dir, metrics=("mse",), name="filter_analysis"):
+        """
+        Writes the analysis table with the 'metrics' columns to {name}.csv and {name}.json in 'output_dir'
+        and returns both paths.
+        """
+        output_dir = pathlib.Path(output_dir)
+        csv_path = output_dir / f"{name}.csv"
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=(*ANALYSIS_COLUMNS, *metrics))
+            writer.writeheader()
+            writer.writerows(rows)
+
+        json_path = output_dir / f"{name}.json"
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+        print(f"Analysis table saved as {csv_path.name} and {json_path.name}")
+        return [csv_path, json_path]
+
+    def run_analysis(self, test_dir=None, output_dir=None, workers=None, filters=None, reference="0.bmp",
+                     metrics=("mse",)):
+        """
+        Main execution method for Lab 6.
+        Every filter is applied to every image of 'test_dir' (default: the 0.bmp ... 8.bmp test images)
+        and compared with the 'reference' image by 'metrics' (any of Metrics.METRICS: mse, psnr, mae, ssim).
+        Images are processed on 'workers' processes, which receive the reference decoded once.
+        'filters' overrides get_filters() with other (name, filter, type) settings.
+        Returns the table rows sorted by the first metric per noise type; with 'output_dir' they are
+        also written to CSV and JSON (see write_analysis).
+        """
+        test_dir = test_dir or self.test_dir
+        metrics = tuple(metrics)
+        unknown = set(metrics) - set(Metrics.METRICS)
+        if not metrics or unknown:
+            print(f"Error: choose metrics from {', '.join(Metrics.METRICS)}.")
+            return
+
+        print(f"Looking for test images in folder: ./{test_dir}/")
+
+        # --- 1. Define Filter Set using ONLY PIL.ImageFilter ---
+        filters = filters or self.get_filters()
 
         # --- 2. Load Reference Image ---
-        ref_path = pathlib.Path(self.test_dir) / "0.bmp"
+        ref_path = pathlib.Path(test_dir) / reference
         if not ref_path.exists():
-            print(f"Error: Reference image '0.bmp' not found in {self.test_dir}.")
+            print(f"Error: Reference image '{reference}' not found in {test_dir}.")
             return
 
         try:
-            ref_img = Image.open(ref_path).convert('L')
+            ref_array = np.asarray(Image.open(ref_path).convert('L'))
         except Exception as e:
             print(f"Error loading reference image: {e}")
             return
 
         # --- 3. Process All Images ---
-        print(f"{'Image':<10} | {'Filter Name':<25} | {'Type':<10} | {'MSE':<10}")
-        print("-" * 65)
-
-        # Обробляємо зображення від 0.bmp до 8.bmp
-        for i in range(9):
-            file_name = f"{i}.bmp"
-            file_path = pathlib.Path(self.test_dir) / file_name
-
-            if not file_path.exists():
-                continue
+        rows = []
+        executor = BatchExecutor(workers, initializer=_init_analysis, initargs=(ref_array, filters, metrics))
+        for result in executor.map(Lab6Processor.analyse_image, ((path,) for path in self.test_images(test_dir))):
+            if result.ok:
+                rows.extend(result.value)
+        rows = self.sort_analysis(rows, metrics[0])
 
-            try:
-                # Відкриваємо та конвертуємо в градації сірого (L)
-                current_img = Image.open(file_path).convert('L')
+        width = 77 + 13 * len(metrics)
+        print(f"{'Noise':<22} | {'Image':<10} | {'Filter Name':<25} | {'Type':<10} | "
+              + " | ".join(f"{metric.upper():>10}" for metric in metrics))
+        print("-" * width)
+        for row in rows:
+            print(f"{row['noise_type']:<22} | {row['image']:<10} | {row['filter']:<25} | {row['filter_type']:<10} | "
+                  + " | ".join(f"{row[metric]:>10.4f}" if metric == 'ssim' else f"{row[metric]:>10.2f}"
+                               for metric in metrics))
+        print("-" * width)
+        for result in executor.errors:
+            print(f"Error processing {pathlib.Path(result.path).name}: {result.error}")
 
-                for f_name, f_obj, f_type in filters:
-                    # Застосування вбудованого фільтра PIL
-                    filtered_img = current_img.filter(f_obj)
+        if output_dir:
+            self.write_analysis(rows, output_dir, metrics)
+        print("Analysis completed.")
+        return rows
 
-                    # Розрахунок помилки відносно еталону (0.bmp)
-                    mse = self.calculate_mse(ref_img, filtered_img)
+    def input_metrics(self):
+        """
+        Asks which metrics to report and returns their names (MSE when nothing valid is entered).
+        """
+        answer = input(f"Metrics to report ({', '.join(Metrics.METRICS)}; default mse): ")
+        metrics = [name for name in answer.lower().replace(",", " ").split() if name in Metrics.METRICS]
+        if not metrics:
+            if answer.strip():
+                print("Unknown metrics. Using MSE.")
+            return ["mse"]
+        return list(dict.fromkeys(metrics))
 
-                    print(f"{file_name:<10} | {f_name:<25} | {f_type:<10} | {mse:.2f}")
+    def analysis(self):
+        """
+        Runs the filter analysis with the metrics chosen by the user.
+        """
+        self.run_analysis(metrics=self.input_metrics())
 
-            except Exception as e:
-                print(f"Error processing {file_name}: {e}")
+    def export_analysis(self):
+        """
+        Runs the filter analysis and saves the results table as CSV and JSON.
+        """
+        output_dir = self.service.get_output_dir()
+        if not output_dir:
+            print("Output directory not selected.")
+            return
 
-        print("-" * 65)
-        print("Analysis completed.")
\ No newline at end of file
+        try:
+            self.run_analysis(output_dir=output_dir, metrics=self.input_metrics())
+        except Exception as e:
+            print(f"Failed to export the analysis: {e}")
@@ -1,12 +1,25 @@
+import argparse
+
 from Menu import Menu
+from Timing import timer
 
 
 def main():
     """
-    Entry point of the program.
+    Entry point of the program. With --timing, per-stage timings are printed on exit.
     """
+    parser = argparse.ArgumentParser(description="Image processing labs.")
+    parser.add_argument("--timing", action="store_true", help="print per-stage timings of every operation")
+    args = parser.parse_args()
+
+    if args.timing:
+        timer.enable()
     menu = Menu()
-    menu.main_menu()
+    try:
+        menu.main_menu()
+    finally:
+        if timer.enabled:
+            timer.summary()
 
 
 if __name__ == "__main__":
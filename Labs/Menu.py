@@ -96,6 +96,7 @@ class Menu:
         print("2. Balance green color")
         print("3. Balance blue color")
         print("4. Balance overall brightness")
+        print("5. Balance red, green and blue in one pass")
 
         self.choice = input('Input your choice: ')
 
@@ -108,6 +109,8 @@ class Menu:
                 self.lab1_processor.image_color_balance("B")
             case '4':
                 self.lab1_processor.image_color_balance("ALL")
+            case '5':
+                self.lab1_processor.image_color_balance("RGB")
             case _:
                 print("Wrong command, try again.")
                 self.color_balance_menu()
@@ -137,6 +140,7 @@ class Menu:
         print("1. Crop")
         print("2. Inverse crop")
         print("3. Slice")
+        print("4. Tile pyramid (deep zoom)")
 
         choice = input("Your choice: ")
         match choice:
@@ -146,6 +150,8 @@ class Menu:
                 self.lab2_processor.invert_crop()
             case '3':
                 self.lab2_processor.slice_image()
+            case '4':
+                self.lab2_processor.create_pyramid()
             case _:
                 print("Wrong command.")
                 self.crop_menu()
@@ -179,6 +185,8 @@ class Menu:
         print("5. Convert to Grayscale")
         print("6. Invert Image (Negative)")
         print("7. Show Grayscale Histogram")
+        print("8. Export Histograms of Many Images")
+        print("9. Grayscale + Negative + Binary at Once")
         print("0. Back to Main Menu")
         self.choice = input('Input your choice: ')
 
@@ -204,6 +212,12 @@ class Menu:
             case '7':
                 self.lab4_processor.show_grayscale_histogram()
                 if self.continue_prompt(): self.main_menu()
+            case '8':
+                self.lab4_processor.export_histograms()
+                if self.continue_prompt(): self.main_menu()
+            case '9':
+                self.lab4_processor.convert_all()
+                if self.continue_prompt(): self.main_menu()
             case '0':
                 self.main_menu()
             case _:
@@ -213,6 +227,7 @@ class Menu:
     def lab5_menu(self):
         print("\n--- Lab 5: Filtering & Edge Detection ---")
         print("1. Roberts Edge Detection (Variant 29->5)")
+        print("2. Edge Detection (Sobel, Prewitt, Scharr, Laplacian)")
         print("0. Back to Main Menu")
         self.choice = input('Input your choice: ')
 
@@ -220,6 +235,9 @@ class Menu:
             case '1':
                 self.lab5_processor.roberts_edge_detection()
                 if self.continue_prompt(): self.main_menu()
+            case '2':
+                self.lab5_processor.edge_detection()
+                if self.continue_prompt(): self.main_menu()
             case '0':
                 self.main_menu()
             case _:
@@ -234,13 +252,17 @@ class Menu:
 
     def lab6_menu(self):
         print("\n--- Lab 6: Noise Reduction Analysis ---")
-        print("1. Run Filter Analysis (Linear & Non-Linear MSE)")
+        print("1. Run Filter Analysis (Linear & Non-Linear; MSE, PSNR, MAE, SSIM)")
+        print("2. Run Filter Analysis and save the results table (CSV/JSON)")
         print("0. Back to Main Menu")
         self.choice = input('Input your choice: ')
 
         match self.choice:
             case '1':
-                self.lab6_processor.run_analysis()
+                self.lab6_processor.analysis()
+                if self.continue_prompt(): self.main_menu()
+            case '2':
+                self.lab6_processor.export_analysis()
                 if self.continue_prompt(): self.main_menu()
             case '0':
                 self.main_menu()
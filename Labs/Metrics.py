@@ -0,0 +1,187 @@
+import math
+
+import numpy as np
+
+# Quality metrics in the order they are reported.
+METRICS = ("mse", "psnr", "mae", "ssim")
+
+# Metrics where a larger value means a closer match.
+HIGHER_IS_BETTER = {"psnr", "ssim"}
+
+# Side of the square SSIM window and the SSIM stabilizing constants for 8-bit images.
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+# Pixels per band of compare(): small enough for the band buffers to stay in the CPU cache.
+BAND_PIXELS = 1 << 17
+
+
+def box_sum(values, size, out, axis):
+    """
+    Writes the sums of 'size' consecutive elements along 'axis' (valid windows only) into 'out'.
+    Uses size - 1 in-place adds of shifted slices, so sums of 8-bit values stay exact in float32.
+    """
+    count = values.shape[axis] - size + 1
+    if axis == 0:
+        np.copyto(out, values[:count])
+        for shift in range(1, size):
+            out += values[shift:shift + count]
+    else:
+        np.copyto(out, values[:, :count])
+        for shift in range(1, size):
+            out += values[:, shift:shift + count]
+
+
+def compare(reference, image, metrics=METRICS, window=SSIM_WINDOW, band_rows=None):
+    """
+    Compares two images (PIL images or arrays of the same shape, 0-255) and returns {metric: value}
+    for the requested 'metrics' from METRICS.
+    Everything is computed in one banded pass over float32 data: MSE and MAE come from the difference d,
+    and SSIM (mean over all valid window x window windows) from box sums of d, s = x + y, d^2 and s^2,
+    since 2*cov(x, y) = (var(s) - var(d)) / 2 and var(x) + var(y) = (var(s) + var(d)) / 2.
+    'band_rows' defaults to about BAND_PIXELS pixels per band.
+    """
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError(f"Unknown metric(s) {', '.join(sorted(unknown))}. Available: {', '.join(METRICS)}")
+    x = np.asarray(reference)
+    y = np.asarray(image)
+    if x.shape != y.shape:
+        raise ValueError(f"Images differ in size: {x.shape} and {y.shape}")
+
+    with_ssim = "ssim" in metrics
+    if with_ssim:
+        if x.ndim != 2:
+            raise ValueError("SSIM needs single-band (grayscale) images")
+        if min(x.shape) < window:
+            raise ValueError(f"SSIM needs images of at least {window}x{window} pixels")
+    else:
+        # Without windows the layout doesn't matter: treat every row as one long line.
+        x = x.reshape(x.shape[0] if x.ndim else 1, -1)
+        y = y.reshape(x.shape)
+        window = 1
+
+    height, width = x.shape
+    halo = window - 1
+    band_rows = min(band_rows or max(2 * window, BAND_PIXELS // width), height)
+    rows = band_rows + halo
+    diff = np.empty((rows, width), dtype=np.float32)
+    scratch = np.empty((rows, width), dtype=np.float32)
+    squared_sum = 0.0
+    absolute_sum = 0.0
+
+    if with_ssim:
+        columns = width - halo
+        total = np.empty((rows, width), dtype=np.float32)
+        horizontal = np.empty((rows, columns), dtype=np.float32)
+        # Window means of d and s, then of d^2 and s^2.
+        means = [np.empty((band_rows, columns), dtype=np.float32) for _ in range(4)]
+        area = window * window
+        # Sample covariance, as in the reference SSIM implementation.
+        cov_norm = area / (area - 1)
+        ssim_sum = 0.0
+
+    for upper in range(0, height, band_rows):
+        lower = min(upper + band_rows, height)
+        own = lower - upper
+        # The windows of this band start on its own rows and reach 'halo' rows below.
+        read_lower = min(lower + halo, height) if with_ssim else lower
+        read = read_lower - upper
+        d = diff[:read]
+        np.subtract(x[upper:read_lower], y[upper:read_lower], out=d, dtype=np.float32)
+
+        squares = scratch[:read]
+        np.multiply(d, d, out=squares)
+        squared_sum += float(squares[:own].sum(dtype=np.float64))
+        if "mae" in metrics:
+            absolute = scratch[:own]
+            np.abs(d[:own], out=absolute)
+            absolute_sum += float(absolute.sum(dtype=np.float64))
+
+        windows = min(lower, height - halo) - upper
+        if not with_ssim or windows <= 0:
+            continue
+
+        s = total[:read]
+        np.add(x[upper:read_lower], y[upper:read_lower], out=s, dtype=np.float32)
+        mean_d, mean_s, mean_d2, mean_s2 = (m[:windows] for m in means)
+        for source, target in ((d, mean_d), (s, mean_s)):
+            box_sum(source, window, horizontal[:read], axis=1)
+            box_sum(horizontal[:read], window, target, axis=0)
+        # d^2 is still in 'scratch' unless MAE reused its rows, so it is recomputed only then.
+        if "mae" in metrics:
+            np.multiply(d, d, out=squares)
+        box_sum(squares, window, horizontal[:read], axis=1)
+        box_sum(horizontal[:read], window, mean_d2, axis=0)
+        np.multiply(s, s, out=squares)
+        box_sum(squares, window, horizontal[:read], axis=1)
+        box_sum(horizontal[:read], window, mean_s2, axis=0)
+        for m in (mean_d, mean_s, mean_d2, mean_s2):
+            m /= area
+
+        # Variances: E[v^2] - E[v]^2, then squared means in place.
+        mean_d *= mean_d
+        mean_s *= mean_s
+        mean_d2 -= mean_d
+        mean_d2 *= cov_norm
+        mean_s2 -= mean_s
+        mean_s2 *= cov_norm
+
+        # numerator = (2 mx my + C1)(2 cov + C2), denominator = (mx^2 + my^2 + C1)(vx + vy + C2)
+        numerator = horizontal[:windows]
+        np.subtract(mean_s, mean_d, out=numerator)
+        numerator *= 0.5
+        numerator += SSIM_C1
+        mean_s += mean_d
+        mean_s *= 0.5
+        mean_s += SSIM_C1
+        np.subtract(mean_s2, mean_d2, out=mean_d)
+        mean_d *= 0.5
+        mean_d += SSIM_C2
+        numerator *= mean_d
+        mean_s2 += mean_d2
+        mean_s2 *= 0.5
+        mean_s2 += SSIM_C2
+        mean_s *= mean_s2
+        numerator /= mean_s
+        ssim_sum += float(numerator.sum(dtype=np.float64))
+
+    pixels = x.size
+    mse = squared_sum / pixels
+    results = {
+        "mse": mse,
+        "psnr": 10 * math.log10(255 ** 2 / mse) if mse > 0 else math.inf,
+        "mae": absolute_sum / pixels,
+    }
+    if with_ssim:
+        results["ssim"] = ssim_sum / ((height - halo) * (width - halo))
+    return {name: results[name] for name in metrics}
+
+
+def mse(reference, image):
+    """
+    Mean squared error of two images.
+    """
+    return compare(reference, image, ("mse",))["mse"]
+
+
+def psnr(reference, image):
+    """
+    Peak signal-to-noise ratio in dB for 8-bit images (inf for identical images).
+    """
+    return compare(reference, image, ("psnr",))["psnr"]
+
+
+def mae(reference, image):
+    """
+    Mean absolute error of two images.
+    """
+    return compare(reference, image, ("mae",))["mae"]
+
+
+def ssim(reference, image, window=SSIM_WINDOW):
+    """
+    Mean structural similarity of two grayscale images over all window x window windows.
+    """
+    return compare(reference, image, ("ssim",), window)["ssim"]
@@ -0,0 +1,135 @@
+from PIL import Image
+import pathlib
+
+import Lab1, Lab2, Lab3, Lab4, Lab5
+from Common import ALL_IMAGE_FORMATS_MAP, load_image, save_image
+from Timing import timer
+
+# Step name -> (processor, image-level method).
+# Every method takes an image as its first argument and returns the new image.
+PIPELINE_STEPS = {
+    # Lab 1
+    "resize": ("lab1", "resize_image"),
+    "recolor": ("lab1", "replace_colors"),
+    "color_balance": ("lab1", "balance_channels"),
+    "brightness": ("lab1", "adjust_brightness"),
+    # Lab 2
+    "transparency": ("lab2", "set_alpha"),
+    "alpha_mask": ("lab2", "set_alpha_mask"),
+    "crop": ("lab2", "crop"),
+    "invert_crop": ("lab2", "cut_out"),
+    "contrast": ("lab2", "change_contrast"),
+    "equalize": ("lab2", "equalize"),
+    "clahe": ("lab2", "clahe"),
+    # Lab 3
+    "watermark": ("lab3", "add_text"),
+    # Lab 4
+    "grayscale": ("lab4", "to_grayscale"),
+    "negative": ("lab4", "to_negative"),
+    "binarize": ("lab4", "to_binary"),
+    # Lab 5
+    "roberts": ("lab5", "roberts_edge_image"),
+    "edges": ("lab5", "edge_image"),
+}
+
+
+class Pipeline:
+    """
+    A chain of image-level Lab operations that runs in memory:
+    each file is decoded once, passed through every step and encoded once.
+    """
+
+    def __init__(self, processor, steps=()):
+        self.processor = processor
+        self.steps = []
+        for step in steps:
+            # Steps come as {"operation": name, "params": {...}} or as [name, params].
+            if isinstance(step, dict):
+                self.add(step["operation"], **step.get("params", {}))
+            else:
+                self.add(step[0], **(step[1] if len(step) > 1 else {}))
+
+    def add(self, name, **params):
+        """
+        Appends a step from PIPELINE_STEPS and returns the pipeline, so calls can be chained.
+        """
+        if name not in PIPELINE_STEPS:
+            raise ValueError(f"Unknown pipeline step '{name}'. Available: {', '.join(PIPELINE_STEPS)}")
+        lab, method = PIPELINE_STEPS[name]
+        func = getattr(self.processor.processors[lab], method)
+
+        if name == "watermark" and "font" not in params:
+            # Load the font once for the pipeline instead of once per image.
+            params["font"] = self.processor.processors["lab3"].load_font(
+                params.get("font_choice", "1"), params.get("font_size", 36))
+
+        self.steps.append((name, func, params))
+        return self
+
+    def apply(self, img):
+        """
+        Runs every step on an image and returns the result.
+        """
+        for name, func, params in self.steps:
+            img = func(img, **params)
+            if isinstance(img, tuple):
+                # Kernels that also report a value (e.g. the changed-pixel count) return (image, value).
+                img, value = img
+                print(f"{name}: {value}")
+        return img
+
+    def run_file(self, path, output_dir, targeted_format=None, suffix="_pipeline"):
+        """
+        Decodes one file, applies the pipeline and encodes the result once.
+        Without 'targeted_format' the source format is kept. Returns the output path.
+        """
+        # Image.open is lazy, so a leading 'resize' step with fast=True can still draft-decode.
+        img = self.apply(load_image(path, lazy=True))
+
+        if targeted_format is None:
+            extension = pathlib.Path(path).suffix
+        else:
+            # PIL prefers 'jpeg' over 'jpg' for saving.
+            if targeted_format == 'jpg':
+                targeted_format = 'jpeg'
+            extension = ALL_IMAGE_FORMATS_MAP[targeted_format]
+        save_format = Image.registered_extensions().get(extension.lower())
+
+        if save_format is not None:
+            # Flatten transparency only at the end, where the output format is known.
+            img = Lab1.Lab1Processor.prepare_for_format(img, save_format)
+
+        filename = pathlib.Path(path).stem + suffix + extension
+        output_path = pathlib.Path(output_dir) / filename
+        save_image(img, output_path, format=save_format, quality=90)
+        print(f"Pipeline result saved as {filename}")
+        return output_path
+
+
+class PipelineProcessor:
+    """
+    Builds and runs pipelines over the Lab 1 - Lab 5 processors.
+    Already created processors may be shared by passing them as a dict.
+    """
+
+    def __init__(self, processors=None):
+        self.processors = processors or {
+            "lab1": Lab1.Lab1Processor(),
+            "lab2": Lab2.Lab2Processor(),
+            "lab3": Lab3.Lab3Processor(),
+            "lab4": Lab4.Lab4Processor(),
+            "lab5": Lab5.Lab5Processor(),
+        }
+
+    def build(self, steps=()):
+        """
+        Creates a pipeline from a list of steps.
+        """
+        return Pipeline(self, steps)
+
+    @timer.timed
+    def pipeline_file(self, path, output_dir, steps, targeted_format=None, suffix="_pipeline"):
+        """
+        Runs the steps on one image file with a single decode and encode and returns the output path.
+        """
+        return self.build(steps).run_file(path, output_dir, targeted_format, suffix)
@@ -0,0 +1,449 @@
+from PIL import Image, ImageFilter, TiffImagePlugin, TiffTags
+import numpy as np
+import io
+import math
+import pathlib
+import struct
+
+import Lab1, Lab2, Lab4, Lab5, Lab6
+from Timing import timer
+
+# Operation name -> (processor, image-level method) for operations that map every pixel on its own.
+TILED_POINT_OPERATIONS = {
+    "color_balance": ("lab1", "balance_channels"),
+    "transparency": ("lab2", "set_alpha"),
+    "grayscale": ("lab4", "to_grayscale"),
+    "negative": ("lab4", "to_negative"),
+    "binarize": ("lab4", "to_binary"),
+}
+
+# TIFF tags that describe the layout or point to other data in the file. They are rewritten (or dropped)
+# when a region of a compressed TIFF is repacked into a small in-memory TIFF.
+TIFF_LAYOUT_TAGS = {
+    256, 257,  # ImageWidth, ImageLength
+    273, 278, 279,  # StripOffsets, RowsPerStrip, StripByteCounts
+    322, 323, 324, 325,  # TileWidth, TileLength, TileOffsets, TileByteCounts
+    330, 513, 514,  # SubIFDs, JPEGInterchangeFormat(Length)
+    34665, 34853, 40965,  # Exif, GPS and Interoperability IFDs
+}
+
+
+class RegionReader:
+    """
+    Reads rectangular regions of an image file without decoding the whole image where the format allows it.
+    Files with one uncompressed raster (uncompressed TIFF, BMP, PPM) are read by scanline ranges, and
+    compressed TIFFs (LZW, deflate, JPEG, PackBits; tiled or striped) by the tiles or strips that overlap
+    the region. JPEG, PNG and other formats can't be decoded in parts: they fall back to one full decode
+    that is kept for later reads ('supports_regions' is False then).
+    """
+
+    def __init__(self, path):
+        # One open file for all reads; Image.open on it only parses the header.
+        self.fp = open(path, 'rb')
+        img = Image.open(self.fp)
+        self.size = img.size
+        self.mode = img.mode
+        self.format = img.format
+        self.chunks = None
+        self.supports_regions = self._region_tiles(img, (0, 0, *img.size)) is not None
+        if not self.supports_regions:
+            # Compressed TIFF: read the tiles/strips by the offsets in its tags.
+            self.chunks = self._tiff_chunks(img)
+            self.supports_regions = self.chunks is not None
+        self.full = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.full is not None:
+            self.full.close()
+        self.fp.close()
+
+    def read(self, box):
+        """
+        Returns the (left, upper, right, lower) region as a loaded image.
+        Parts of the box outside the image are filled with zeros, as in Image.crop.
+        """
+        box = tuple(box)
+        width, height = self.size
+        inside = (max(box[0], 0), max(box[1], 0), min(box[2], width), min(box[3], height))
+        if inside != box:
+            part = self.read(inside) if inside[0] < inside[2] and inside[1] < inside[3] else None
+            region = Image.new(self.mode, (box[2] - box[0], box[3] - box[1]))
+            if part is not None:
+                if part.palette is not None:
+                    region.putpalette(part.getpalette())
+                region.paste(part, (inside[0] - box[0], inside[1] - box[1]))
+            return region
+
+        if not self.supports_regions:
+            if self.full is None:
+                self.fp.seek(0)
+                self.full = Image.open(self.fp)
+                self.full.load()
+            return self.full.crop(box)
+
+        if self.chunks is not None:
+            region, data = self._tiff_region(box)
+            img = Image.open(io.BytesIO(data))
+            img.load()
+            return img.crop((box[0] - region[0], box[1] - region[1], box[2] - region[0], box[3] - region[1]))
+
+        self.fp.seek(0)
+        img = Image.open(self.fp)
+        region, tiles = self._region_tiles(img, box)
+        # Decode only the tiles of 'region', as if it were the whole image.
+        img._size = (region[2] - region[0], region[3] - region[1])
+        img.tile = tiles
+        img.load()
+        return img.crop((box[0] - region[0], box[1] - region[1], box[2] - region[0], box[3] - region[1]))
+
+    def _region_tiles(self, img, box):
+        """
+        Returns (region, tiles): the smallest decodable region that covers 'box' and its tile list
+        moved to the region origin, or None when the format can only be decoded as a whole.
+        """
+        if len(img.tile) > 1:
+            # Independent tiles/strips: keep the ones that overlap the box.
+            tiles = [tile for tile in img.tile
+                     if tile[1][0] < box[2] and tile[1][2] > box[0] and tile[1][1] < box[3] and tile[1][3] > box[1]]
+            if not tiles:
+                return None
+            region = (min(tile[1][0] for tile in tiles), min(tile[1][1] for tile in tiles),
+                      max(tile[1][2] for tile in tiles), max(tile[1][3] for tile in tiles))
+            return region, [self._moved_tile(tile, (tile[1][0] - region[0], tile[1][1] - region[1],
+                                                    tile[1][2] - region[0], tile[1][3] - region[1]))
+                            for tile in tiles]
+
+        if len(img.tile) != 1:
+            return None
+        codec, extents, offset, args = img.tile[0]
+        width, height = img.size
+        if codec != 'raw' or tuple(extents) != (0, 0, width, height):
+            return None
+
+        # One uncompressed raster: find where the wanted rows start.
+        if isinstance(args, str):
+            args = (args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+        if not stride:
+            if rawmode == '1':
+                stride = (width + 7) // 8
+            elif rawmode.isalpha():
+                # Plain 8-bit-per-band raw modes such as 'L', 'RGB' or 'BGRA'.
+                stride = width * len(rawmode)
+            else:
+                return None
+
+        upper, lower = box[1], box[3]
+        if orientation < 0:
+            # Bottom-up rasters (BMP) store the lowest row first.
+            offset += (height - lower) * stride
+        else:
+            offset += upper * stride
+        region = (0, upper, width, lower)
+        return region, [self._moved_tile(img.tile[0], (0, 0, width, lower - upper), offset,
+                                         (rawmode, stride, orientation))]
+
+    def _tiff_chunks(self, img):
+        """
+        Returns the tile/strip layout of a compressed TIFF (Pillow hands those to libtiff as one tile),
+        or None for other files and for layouts the region reads don't handle.
+        """
+        if img.format != 'TIFF' or len(img.tile) != 1 or img.tile[0][0] != 'libtiff':
+            return None
+        tags = img.tag_v2
+        if tags.get(284, 1) != 1:
+            # Separate colour planes would need one chunk list per plane.
+            return None
+        width, height = img.size
+        if 324 in tags and 325 in tags:
+            chunk_size = (tags[322], tags[323])
+            offsets, counts = tags[324], tags[325]
+        elif 273 in tags and 279 in tags:
+            chunk_size = (width, min(tags.get(278, height), height))
+            offsets, counts = tags[273], tags[279]
+        else:
+            return None
+        return {"tiled": 324 in tags, "size": chunk_size, "offsets": tuple(offsets), "counts": tuple(counts),
+                "tags": tags}
+
+    def _tiff_region(self, box):
+        """
+        Returns (region, data): the region covered by the tiles/strips that overlap 'box' and an in-memory
+        TIFF holding just their compressed bytes, which libtiff then decodes as a small image.
+        """
+        width, height = self.size
+        chunk_width, chunk_height = self.chunks["size"]
+        first_row, last_row = box[1] // chunk_height, (box[3] - 1) // chunk_height
+        if self.chunks["tiled"]:
+            across = math.ceil(width / chunk_width)
+            first_column, last_column = box[0] // chunk_width, (box[2] - 1) // chunk_width
+            indices = [row * across + column for row in range(first_row, last_row + 1)
+                       for column in range(first_column, last_column + 1)]
+            # Edge tiles are stored full size, so the region may reach past the image.
+            region = (first_column * chunk_width, first_row * chunk_height,
+                      (last_column + 1) * chunk_width, (last_row + 1) * chunk_height)
+        else:
+            indices = range(first_row, last_row + 1)
+            region = (0, first_row * chunk_height, width, min((last_row + 1) * chunk_height, height))
+
+        chunks = []
+        for index in indices:
+            self.fp.seek(self.chunks["offsets"][index])
+            chunks.append(self.fp.read(self.chunks["counts"][index]))
+
+        tags = self.chunks["tags"]
+        ifd = TiffImagePlugin.ImageFileDirectory_v2(prefix=tags.prefix)
+        for tag, value in tags.items():
+            if tag not in TIFF_LAYOUT_TAGS:
+                ifd[tag] = value
+                ifd.tagtype[tag] = tags.tagtype[tag]
+        ifd[256], ifd[257] = region[2] - region[0], region[3] - region[1]
+        if self.chunks["tiled"]:
+            ifd[322], ifd[323] = chunk_width, chunk_height
+            offsets_tag, counts_tag = 324, 325
+        else:
+            ifd[278] = chunk_height
+            offsets_tag, counts_tag = 273, 279
+        ifd[counts_tag] = tuple(len(chunk) for chunk in chunks)
+        ifd.tagtype[counts_tag] = ifd.tagtype[offsets_tag] = TiffTags.LONG
+
+        # Header, IFD, then the chunks back to back.
+        byte_order = '<' if tags.prefix == b'II' else '>'
+        header = tags.prefix + struct.pack(byte_order + 'HI', 42, 8)
+        offsets = np.cumsum([0] + [len(chunk) for chunk in chunks[:-1]]).tolist()
+        if self.chunks["tiled"]:
+            # Pillow moves StripOffsets past the IFD by itself (as when saving), TileOffsets must be absolute.
+            # The IFD size doesn't depend on the offset values.
+            ifd[offsets_tag] = tuple(offsets)
+            start = len(header) + len(ifd.tobytes(len(header)))
+            offsets = [start + offset for offset in offsets]
+        ifd[offsets_tag] = tuple(offsets)
+        return region, header + ifd.tobytes(len(header)) + b"".join(chunks)
+
+    def _moved_tile(self, tile, extents, offset=None, args=None):
+        """
+        Returns a copy of 'tile' with new extents and, optionally, a new offset and decoder args.
+        """
+        codec, _, tile_offset, tile_args = tile
+        offset = tile_offset if offset is None else offset
+        args = tile_args if args is None else args
+        if hasattr(tile, '_replace'):
+            # Newer Pillow versions use a named tuple and read its fields while loading.
+            return tile._replace(extents=extents, offset=offset, args=args)
+        return codec, extents, offset, args
+
+
+class TiffStripWriter:
+    """
+    Writes an uncompressed striped TIFF one horizontal band at a time,
+    so the whole output never has to be in memory. Supports '1', 'L', 'RGB' and 'RGBA' images.
+    """
+
+    # mode -> (bits per sample, samples per pixel, photometric interpretation)
+    MODES = {'1': (1, 1, 1), 'L': (8, 1, 1), 'RGB': (8, 3, 2), 'RGBA': (8, 4, 2)}
+
+    def __init__(self, path, size, mode, rows_per_strip):
+        if mode not in self.MODES:
+            raise ValueError(f"Tiled output does not support mode {mode}")
+        self.size = size
+        self.mode = mode
+        self.rows_per_strip = rows_per_strip
+        self.strip_offsets = []
+        self.strip_byte_counts = []
+        self.f = open(path, 'wb')
+        # Little-endian header; the IFD offset is filled in by close().
+        self.f.write(b'II*\x00\x00\x00\x00\x00')
+
+    def write(self, band):
+        """
+        Appends the next band of rows; every band except the last must have 'rows_per_strip' rows.
+        """
+        data = band.tobytes()
+        self.strip_offsets.append(self.f.tell())
+        self.strip_byte_counts.append(len(data))
+        self.f.write(data)
+
+    def close(self):
+        bits, samples, photometric = self.MODES[self.mode]
+        count = len(self.strip_offsets)
+
+        # Tag values that don't fit into 4 bytes are stored before the IFD.
+        self._align()
+        bits_offset = self.f.tell()
+        self.f.write(struct.pack(f'<{samples}H', *[bits] * samples))
+        self._align()
+        offsets_offset = self.f.tell()
+        self.f.write(struct.pack(f'<{count}L', *self.strip_offsets))
+        counts_offset = self.f.tell()
+        self.f.write(struct.pack(f'<{count}L', *self.strip_byte_counts))
+
+        # (tag, type, count, value); type 3 = SHORT, 4 = LONG.
+        entries = [
+            (256, 4, 1, self.size[0]),  # ImageWidth
+            (257, 4, 1, self.size[1]),  # ImageLength
+            (258, 3, samples, bits if samples == 1 else bits_offset),  # BitsPerSample
+            (259, 3, 1, 1),  # Compression: none
+            (262, 3, 1, photometric),  # PhotometricInterpretation
+            (273, 4, count, self.strip_offsets[0] if count == 1 else offsets_offset),  # StripOffsets
+            (277, 3, 1, samples),  # SamplesPerPixel
+            (278, 4, 1, self.rows_per_strip),  # RowsPerStrip
+            (279, 4, count, self.strip_byte_counts[0] if count == 1 else counts_offset),  # StripByteCounts
+            (284, 3, 1, 1),  # PlanarConfiguration: contiguous
+        ]
+        if self.mode == 'RGBA':
+            entries.append((338, 3, 1, 2))  # ExtraSamples: unassociated alpha
+
+        self._align()
+        ifd_offset = self.f.tell()
+        self.f.write(struct.pack('<H', len(entries)))
+        for tag, value_type, value_count, value in entries:
+            if value_type == 3 and value_count == 1:
+                self.f.write(struct.pack('<HHLHH', tag, value_type, value_count, value, 0))
+            else:
+                self.f.write(struct.pack('<HHLL', tag, value_type, value_count, value))
+        self.f.write(struct.pack('<L', 0))  # No next IFD
+
+        self.f.seek(4)
+        self.f.write(struct.pack('<L', ifd_offset))
+        self.f.close()
+
+    def _align(self):
+        # TIFF offsets must be word aligned.
+        if self.f.tell() % 2:
+            self.f.write(b'\x00')
+
+
+class TiledProcessor:
+    """
+    Runs point and neighborhood operations on huge images band by band.
+    Each band is read with RegionReader (with a halo of extra rows for neighborhood operations),
+    processed and appended to a striped TIFF, so peak memory follows the band size, not the image size.
+    """
+
+    def __init__(self, processors=None):
+        self.processors = processors or {
+            "lab1": Lab1.Lab1Processor(),
+            "lab2": Lab2.Lab2Processor(),
+            "lab4": Lab4.Lab4Processor(),
+            "lab5": Lab5.Lab5Processor(),
+            "lab6": Lab6.Lab6Processor(),
+        }
+
+    def bands(self, height, band_rows, halo=0):
+        """
+        Yields (upper, lower, read_upper, read_lower) for every band: the rows to produce
+        and the rows to read, including up to 'halo' extra rows on each side.
+        """
+        for upper in range(0, height, band_rows):
+            lower = min(upper + band_rows, height)
+            yield upper, lower, max(0, upper - halo), min(height, lower + halo)
+
+    def filter_halo(self, image_filter):
+        """
+        Returns how many neighbouring rows a PIL filter needs to match its full-image result.
+        """
+        if hasattr(image_filter, 'size'):
+            # Rank and mode filters look at a size x size window.
+            return image_filter.size // 2
+        radius = image_filter.radius
+        if isinstance(radius, (tuple, list)):
+            radius = max(radius)
+        if isinstance(image_filter, ImageFilter.BoxBlur):
+            return math.ceil(radius) + 1
+        # Gaussian-based filters are three box blur passes that together reach about five radii.
+        return math.ceil(radius * 5) + 2
+
+    def map_bands(self, reader, writer_path, band_rows, halo, func):
+        """
+        Applies 'func' to every band read with 'halo' rows on each side and writes the cropped results.
+        """
+        width, height = reader.size
+        writer = None
+        for upper, lower, read_upper, read_lower in self.bands(height, band_rows, halo):
+            with timer.stage("decode"):
+                band = reader.read((0, read_upper, width, read_lower))
+            band = func(band)
+            band = band.crop((0, upper - read_upper, width, lower - read_upper))
+            if writer is None:
+                writer = TiffStripWriter(writer_path, reader.size, band.mode, band_rows)
+            # Strips are stored uncompressed, so writing them is the whole output stage.
+            with timer.stage("write"):
+                writer.write(band)
+        writer.close()
+
+    @timer.timed
+    def tiled_file(self, path, output_dir, operation, band_rows=512, **params):
+        """
+        Runs 'operation' on one image file band by band and returns the output TIFF path.
+        'operation' is one of TILED_POINT_OPERATIONS, 'roberts' or 'filter' (with 'filter_name'
+        from the Lab 6 filter set). Extra parameters go to the point operation.
+        """
+        filename = pathlib.Path(path).stem + f"_{operation}_tiled.tiff"
+        output_path = pathlib.Path(output_dir) / filename
+
+        with RegionReader(path) as reader:
+            if not reader.supports_regions:
+                # Band reads only bound memory for TIFF, BMP and PPM; warn before a large full decode.
+                megabytes = reader.size[0] * reader.size[1] * Image.getmodebands(reader.mode) / 2 ** 20
+                print(f"Warning: {reader.format} can't be read by bands, so {pathlib.Path(path).name} is decoded "
+                      f"whole (about {megabytes:.0f} MB in memory). Convert it to TIFF to process it band by band.")
+
+            if operation in TILED_POINT_OPERATIONS:
+                lab, method = TILED_POINT_OPERATIONS[operation]
+                func = getattr(self.processors[lab], method)
+                self.map_bands(reader, output_path, band_rows, 0, lambda band: func(band, **params))
+
+            elif operation == 'filter':
+                filters = {name: f_obj for name, f_obj, _ in self.processors["lab6"].get_filters()}
+                image_filter = filters[params["filter_name"]]
+                halo = self.filter_halo(image_filter)
+                self.map_bands(reader, output_path, band_rows, halo,
+                               lambda band: band.convert('L').filter(image_filter))
+
+            elif operation == 'roberts':
+                self.roberts_tiled(reader, output_path, band_rows)
+
+            else:
+                raise ValueError(f"Unknown tiled operation '{operation}'")
+
+        print(f"Tiled {operation} saved as {filename}")
+        return output_path
+
+    def roberts_tiled(self, reader, output_path, band_rows):
+        """
+        Roberts edge detection in two passes: the first finds the global maximum for normalization,
+        the second computes every band again and writes it. Each band reads one extra row below.
+        """
+        lab5 = self.processors["lab5"]
+        width, height = reader.size
+
+        def band_gradient(upper, lower):
+            read_lower = min(height, lower + 1)
+            with timer.stage("decode"):
+                band = reader.read((0, upper, width, read_lower))
+            with timer.stage("convert"):
+                band = band.convert('L')
+            gradient = lab5.roberts_gradient(np.asarray(band, dtype="int32"))
+            # Keep only the rows of this band (the last band has no row below it).
+            return gradient[:lower - upper]
+
+        max_val = 0
+        for upper, lower, _, _ in self.bands(height, band_rows):
+            gradient = band_gradient(upper, lower)
+            if gradient.size:
+                max_val = max(max_val, gradient.max())
+
+        writer = TiffStripWriter(output_path, reader.size, 'L', band_rows)
+        for upper, lower, _, _ in self.bands(height, band_rows):
+            band = lab5.gradient_to_array(band_gradient(upper, lower), max_val, (lower - upper, width))
+            with timer.stage("write"):
+                writer.write(Image.fromarray(band))
+        writer.close()
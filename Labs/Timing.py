@@ -0,0 +1,122 @@
+import contextlib
+import functools
+import json
+import os
+import time
+
+# Stages in the order they are reported.
+STAGES = ("decode", "convert", "compute", "encode", "write")
+
+
+class StageTimer:
+    """
+    Optional per-file timing of the decode, mode conversion, compute, encode and write stages.
+    Stages nest: time spent in an inner stage (e.g. 'convert' inside 'compute') is charged only
+    to the inner one. When disabled, every call is a cheap no-op.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self._record = None
+        self._stack = []
+
+    def enable(self):
+        self.enabled = True
+        self.records = []
+
+    @contextlib.contextmanager
+    def _track(self, operation, path):
+        record = {"operation": operation, "file": str(path), "stages": dict.fromkeys(STAGES, 0.0)}
+        outer = (self._record, self._stack)
+        self._record, self._stack = record, []
+        start = time.perf_counter()
+        try:
+            # Time outside of any stage counts as compute.
+            with self.stage("compute"):
+                yield
+        finally:
+            record["total"] = time.perf_counter() - start
+            self.records.append(record)
+            self._record, self._stack = outer
+
+    def track(self, operation, path):
+        """
+        Context manager that records the stages of one file of 'operation'.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._track(operation, path)
+
+    def timed(self, func):
+        """
+        Decorator for per-file methods: records one file per call, taking the path from the first argument
+        (after 'self' for methods). The operation is named after the method.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            # Staticmethods get the path first, methods get 'self' first.
+            path = args[0] if isinstance(args[0], (str, os.PathLike, list, tuple)) else args[1]
+            with self._track(func.__name__, path):
+                return func(*args, **kwargs)
+        return wrapper
+
+    @contextlib.contextmanager
+    def _stage(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            # Pause the enclosing stage.
+            outer_name, outer_start = self._stack[-1]
+            self._record["stages"][outer_name] += now - outer_start
+        self._stack.append((name, now))
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            _, start = self._stack.pop()
+            self._record["stages"][name] += now - start
+            if self._stack:
+                # Resume the enclosing stage.
+                self._stack[-1] = (self._stack[-1][0], now)
+
+    def stage(self, name):
+        """
+        Context manager that charges the time of its block to stage 'name' of the current file.
+        """
+        if not self.enabled or self._record is None:
+            return contextlib.nullcontext()
+        return self._stage(name)
+
+    def summary(self):
+        """
+        Prints the total and per-file mean time of every stage for each operation.
+        """
+        if not self.records:
+            print("No timing records.")
+            return
+        operations = {}
+        for record in self.records:
+            operations.setdefault(record["operation"], []).append(record)
+
+        print("\n--- Timing summary (ms) ---")
+        print(f"{'Operation':<26} {'Files':>5} " + " ".join(f"{stage:>9}" for stage in STAGES) + f" {'total':>10}")
+        for operation, records in operations.items():
+            totals = [sum(r["stages"][stage] for r in records) * 1000 for stage in STAGES]
+            total = sum(r["total"] for r in records) * 1000
+            print(f"{operation:<26} {len(records):>5} " + " ".join(f"{t:>9.1f}" for t in totals) + f" {total:>10.1f}")
+            dominant = STAGES[totals.index(max(totals))]
+            print(f"{'':<26} {'':>5} mean per file {total / len(records):.1f} ms, dominated by {dominant}")
+
+    def write_json(self, path):
+        """
+        Writes every record (times in seconds) to a JSON file.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.records, f, indent=2)
+        print(f"Timing records saved to {path}")
+
+
+# Shared timer of the current process.
+timer = StageTimer()
@@ -0,0 +1,61 @@
+import pathlib
+import tempfile
+import unittest
+
+from PIL import Image
+
+from Cache import ResultCache
+from Headless import HeadlessRunner
+
+
+class SpecCacheTest(unittest.TestCase):
+    """
+    The cache key covers the content of a crop spec file, so editing the spec invalidates cached results.
+    """
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.temp.name)
+        self.image = self.root / "image.png"
+        Image.new("RGB", (256, 256), (247, 56, 67)).save(self.image)
+        self.spec = self.root / "spec.txt"
+        self.output_dir = self.root / "out"
+        self.runner = HeadlessRunner(ResultCache(self.root / "cache"))
+
+    def tearDown(self):
+        self.temp.cleanup()
+
+    def run_operation(self, operation):
+        job = {"operation": operation, "files": [str(self.image)],
+               "output_dir": str(self.output_dir), "params": {"spec": str(self.spec)}}
+        self.assertEqual(self.runner.run_job(job), 0)
+
+    def test_invert_crop_spec_edit(self):
+        output = self.output_dir / "image_inverted_crop.png"
+        self.spec.write_text("0 0 50 50\n", encoding="utf-8")
+        self.run_operation("invert_crop")
+        with Image.open(output) as img:
+            self.assertEqual(img.getpixel((100, 100)), (247, 56, 67, 255))
+
+        self.spec.write_text("100 100 200 200\n", encoding="utf-8")
+        self.run_operation("invert_crop")
+        self.assertEqual(self.runner.cache_hits, 0)
+        with Image.open(output) as img:
+            self.assertEqual(img.getpixel((100, 100)), (0, 0, 0, 0))
+            self.assertEqual(img.getpixel((10, 10)), (247, 56, 67, 255))
+
+    def test_crop_spec_is_cached(self):
+        self.spec.write_text("0 0 50 50 corner\n", encoding="utf-8")
+        self.run_operation("crop_spec")
+        self.run_operation("crop_spec")
+        self.assertEqual((self.runner.cache_hits, self.runner.cache_misses), (1, 1))
+
+        self.spec.write_text("0 0 80 40 corner\n", encoding="utf-8")
+        self.run_operation("crop_spec")
+        self.assertEqual(self.runner.cache_misses, 2)
+        with Image.open(self.output_dir / "image_crop_corner.png") as img:
+            self.assertEqual(img.size, (80, 40))
+
+
+if __name__ == "__main__":
+    unittest.main()